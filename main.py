@@ -14,10 +14,19 @@ set_parameters("resources\configs\main-05062020-132549")
 from source.path_planning.frame_handler import FrameHandler
 from source.data_send_receive.instruction_handler import InstructionHandler
 from source.vision_identification import bounding_box
+from source.vision_identification.video_reader import TriggeredCapture
+from source.vision_identification import frame_cache
+
+STATS_TOGGLE = False # Prints the detection gate and frame governor counters on exit
 
 frame_handler = FrameHandler()
 instruction_handler = InstructionHandler()
-video_capture = cv2.VideoCapture(r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4")
+# Every frame is grabbed to stay in sync, only triggered (and GRAB_SUBSAMPLE) frames are passed on.
+# The recording is replayed from its scaled frame cache, built on the first run.
+cache = frame_cache.open_cache(r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4", width=250)
+if cache is None: # open_cache has already printed why
+    sys.exit(1)
+video_capture = TriggeredCapture(cache)
 times = []
 
 instruction_handler.start()
@@ -25,6 +34,7 @@ instruction_handler.start()
 with PLC() as plc:
     plc.IPAddress = global_parameters['PLC_IP']
     count_flag = False
+    display_frame = None
 
     while True:
         ### Read and process PLC data ### 
@@ -78,34 +88,34 @@ with PLC() as plc:
         read_time = time.time()
 
         #To be replaced by camera trigger software 
-        (val, frame) = video_capture.read() 
+        (val, frame) = video_capture.read(trigger=count_flag) 
 
         if not count_flag:
             val = 0
         else:
             count_flag = False
 
-        if val != 0: # If image is available
+        if val != 0 and frame is not None: # If image is available
             if frame_handler.process_frame(frame, read_time, draw=True):
+                # A frame can complete more than one pair, each path is its own command
                 time_stamps, profiles = frame_handler.get_results()
-
-                flag = False
-                for i in range(0, len(profiles)):
-                    # Adds full path to instruction handler 
-                    instruction_handler.add(time_stamps[i], profiles[i])
-                    flag = True
-                if flag:
+                while len(profiles) > 0:
+                    for i in range(0, len(profiles)):
+                        # Adds full path to instruction handler 
+                        instruction_handler.add(time_stamps[i], profiles[i])
                     instruction_handler.add(0, 0) # Ending flag. This is how the handler knows the command is over
+                    time_stamps, profiles = frame_handler.get_results()
         ################################
 
 
         #### Just for visualization ####
         # else:
-        frame = bounding_box.scale(frame)
-        frame = cv2.copyMakeBorder(frame, 0, 300, 300, 300, cv2.BORDER_CONSTANT, value=0)
+        if frame is not None: # Untriggered frames are only decoded every GRAB_SUBSAMPLE grabs
+            display_frame = bounding_box.pad_to_canvas(bounding_box.scale(frame))
+            global_parameters['PICKUP_POINT'].draw(display_frame)
 
-        global_parameters['PICKUP_POINT'].draw(frame)
-        cv2.imshow("Temp", frame)
+        if display_frame is not None:
+            cv2.imshow("Temp", display_frame)
 
         k = cv2.waitKey(max(global_parameters['FRAME_RATE'] - round((time.time() - read_time )*1000 + 1), 1)) & 0xFF
         if k == ord('q'):    
@@ -114,4 +124,8 @@ with PLC() as plc:
             count_flag = True
         #################################
         
+    if STATS_TOGGLE and frame_handler.gate is not None:
+        print(frame_handler.gate)
+    if STATS_TOGGLE and frame_handler.governor is not None:
+        print(frame_handler.governor)
     instruction_handler.stop()
\ No newline at end of file
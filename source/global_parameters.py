@@ -7,9 +7,9 @@ from datetime import datetime
 '''
 
 if __name__=="__main__":
-    from model.point import Point
+    from model.point import Point, PointArray
 else:
-    from .model.point import Point
+    from .model.point import Point, PointArray
 
 now = datetime.now()
 dt_string = now.strftime("-%d%m%Y-%H%M%S")
@@ -28,13 +28,19 @@ params_1 = { # Parameters
     #########################
 
     "VIDEO_SCALE" : 212,                                       # Pixels / m 
+    "SCALE_METHOD" : "cubic",                                  # Frame downscaling: auto, cubic, linear, nearest, area, pyramid or stride
+    "CALIBRATION_FILE" : None,                                 # Camera calibration (.npz) to undistort and rectify frames with instead of scaling them
     "RUNTIME_FACTOR" : 1,
     "FPS" : 30, 
+    "GRAB_SUBSAMPLE" : 0,                                      # Untriggered frames are only decoded every n grabs, 0 = triggered frames only
 
     "MINIMUM_MIDDLE_SIZE" : 0.18,                              # Minimum middle size in m^2
 
     "LOWER_MASK" : np.array([0, 71, 99]),      # Default lower mask
     "UPPER_MASK" : np.array([9, 191, 212]),    # Default upper mask
+    "COLOUR_LUT" : False,                      # Masks frames with a BGR lookup table instead of cvtColor + inRange
+    "ORIENTED_BOXES" : True,                   # Rotated boxes from contours, False uses faster axis aligned connected components
+    "STRIPE_THREADS" : 0,                      # Masks frames in this many overlapping row stripes on a thread pool, 0 or 1 masks in one pass
 
     "BOUNDING_BOX_THESHOLD" : 10,
     "LOIN_WIDTH" : 0.021,                      # How far from loin side to make cut in pixels
@@ -42,6 +48,26 @@ params_1 = { # Parameters
     "SHORT_END_FACTOR" : 0.35,                 # Factor for short ends of hog
     "CHANGING_START_INDEX" : False,            # Toggles whether to iterated start indeces 
 
+    "ROI_DETECTION" : True,                    # Only runs detection on the acceptance band, pieces are admitted once wholly inside it
+    "CANVAS_PADDING" : [0, 300, 300, 300],     # Top, bottom, left, right offset in px from the scaled camera frame to the robot canvas
+    "DETECTION_GATE" : False,                  # Skips detection on frames without enough meat coloured area to hold a piece
+    "GATE_STRIDE" : 4,                         # Decimation of the scaled frame checked by the gate
+    "GATE_AREA_FRACTION" : 0.1,                # Fraction of MINIMUM_AREA that has to be meat coloured before detection runs
+    "PREDICTED_WINDOWS" : False,               # Only searches the band's entry strip, where pieces first lie wholly in the band
+    "FULL_SCAN_INTERVAL" : 10,                 # Frames between full band searches when using predicted windows
+    "WINDOW_MARGIN" : 0.05,                    # Slack in m below the entry strip
+    "PIECE_LENGTH" : 0.7,                      # Longest a piece reaches along the belt in m, sizes the entry strip
+
+    "FRAME_GOVERNOR" : False,                  # Steps through GOVERNOR_LEVELS when scaling and detection overrun the frame budget
+    "GOVERNOR_LEVELS" : [                      # Vision parameter overrides, each level cheaper than the last
+        {},
+        {"SCALE_METHOD" : "nearest"},
+        {"SCALE_METHOD" : "nearest", "ORIENTED_BOXES" : False, "GATE_STRIDE" : 8},
+        {"SCALE_METHOD" : "stride", "ORIENTED_BOXES" : False, "GATE_STRIDE" : 8}
+    ],
+    "GOVERNOR_HEADROOM" : [0.5, 0.9],          # Fractions of the frame budget spent scaling and detecting below which quality is restored and above which it is lowered
+    "GOVERNOR_PATIENCE" : 30,                  # Frames under the lower fraction before restoring a level
+
 
     ################################
     ### Path Planning Parameters ###
@@ -75,8 +101,8 @@ params_1 = { # Parameters
     "PHASE_5_PERCENTAGE" : 0.048,
     "PHASE_6_PERCENTAGE" : 0.288,
 
-    "PHASE_3_PATH1" : [Point(440, 435, angle=60), Point(440, 580, angle=110), Point(530, 680, angle=90)],
-    "PHASE_3_PATH2" : [Point(440, 730, angle=60), Point(320, 720, angle=110)],
+    "PHASE_3_PATH1" : PointArray.from_points([Point(440, 435, angle=60), Point(440, 580, angle=110), Point(530, 680, angle=90)]),
+    "PHASE_3_PATH2" : PointArray.from_points([Point(440, 730, angle=60), Point(320, 720, angle=110)]),
 
     ###########################
     ### Physical Parameters ###
@@ -112,8 +138,8 @@ params_2 = {
 
     "CONVEYOR_SPEED" : 2 / params_1['RUNTIME_FACTOR'], #Px/frame
 
-    "PHASE_6_PATH1" : [Point(450, 435, angle=0), params_1['READY_POS_1']],
-    "PHASE_6_PATH2" : [Point(345, 695, angle=0), params_1['READY_POS_2']]
+    "PHASE_6_PATH1" : PointArray.from_points([Point(450, 435, angle=0), params_1['READY_POS_1']]),
+    "PHASE_6_PATH2" : PointArray.from_points([Point(345, 695, angle=0), params_1['READY_POS_2']])
 }
 
 params_3 = {
@@ -128,16 +154,26 @@ params_3 = {
 
 global_parameters = {**{**params_1, **params_2}, **params_3}
 
+# Functions called (with no arguments) every time a configuration file is loaded 
+parameter_listeners = []
+
+def add_parameter_listener(func):
+    parameter_listeners.append(func)
 
 def set_parameters(file_path):
-    global global_parameters
     try:
         f = open(file_path, 'rb')
         data = pickle.load(f)
-        global_parameters = data
+        # Updated in place so every module that imported the dictionary sees the new 
+        # values. Parameters missing from older configuration files keep their defaults. 
+        global_parameters.update(data)
         f.close()
     except:
         print("ERROR: Invalid configuration file.")
+        return
+
+    for func in parameter_listeners:
+        func()
 
 def save_parameters(file_path):
     f = open(file_path, 'wb')
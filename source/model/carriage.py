@@ -7,6 +7,11 @@ from .point import Point
 from ..global_parameters import global_parameters
 from .. import vector_tools
 
+# Signs of k, x1 and x2 in each of the carriage points
+CORNER_K = np.array([[1], [1], [-1], [-1], [1], [-1]])
+CORNER_X1 = np.array([[1], [-1], [-1], [1], [-1], [-1]])
+CORNER_X2 = np.array([[0], [0], [0], [0], [1], [1]])
+
 class Carriage:
     def __init__(self, pt:Point, scale, angle=0, downward_extension=0, gripper_extension=0.5):
         self.scale = scale
@@ -55,32 +60,24 @@ class Carriage:
         self.update_points()
 
     def update_points(self):
-        self.points = []
-
         k = np.array([self.length*math.cos(math.radians(self.angle))/2, -1 * self.length*math.sin(math.radians(self.angle))/2])
         x = vector_tools.get_normal_unit([0, 0], k)
         x1 = x * self.width/2
         x2 = x * self.gripper_extension * self.scale
 
-        self.points += [(self.base_pt.toArray() + k + x1)] # top right
-        self.points += [(self.base_pt.toArray() + k - x1)] # top left
-        self.points += [(self.base_pt.toArray() - k - x1)] # bottom left
-        self.points += [(self.base_pt.toArray() - k + x1)] # bottom right 
-        self.points += [(self.base_pt.toArray() + k - x1 + x2)] # gripper top right
-        self.points += [(self.base_pt.toArray() - k - x1 + x2)] # gripper bottom right 
+        # Rows are top right, top left, bottom left, bottom right, gripper top right, gripper bottom right
+        self.points = self.base_pt.toArray() + CORNER_K * k + CORNER_X1 * x1 + CORNER_X2 * x2
         self.other_pt = self.get_other_pt()
 
     def get_collision_bounds(self):
         r1 = np.subtract(self.points[1], self.points[2])
         if self.gripper_extension < global_parameters['CARRIAGE_WIDTH']:
-            print("less")
             r2 = np.subtract(self.points[1], self.points[0]) 
             r3 = np.subtract(self.points[3], self.points[2])
             r4 = np.subtract(self.points[3], self.points[0])
 
             return [[self.points[1], r3], [self.points[1], r4], [self.points[3], r1], [self.points[3], r2]]
         else:
-            print("more")
             r2 = np.subtract(self.points[1], self.points[4]) 
             r3 = np.subtract(self.points[5], self.points[2])
             r4 = np.subtract(self.points[5], self.points[4])
@@ -97,6 +94,7 @@ class Carriage:
         '''
         angle = (state[2] + state[1] + 180 + 720) % 360
         self.__init__(state[0], self.scale, angle, state[3], state[4])
+        self.refresh(state[1])
 
     def close(self, width):
         if self.gripper_extension > width:
@@ -0,0 +1,126 @@
+import numpy as np
+
+from ..global_parameters import global_parameters
+from .carriage import CORNER_K, CORNER_X1, CORNER_X2
+
+'''
+    Array version of Robot.collision_check. Every collision bound of the
+    robot is a segment (p, r) from p to p + r. The segments of a state are
+    packed into an 11 x 2 x 2 array, in the order
+
+        0-1     Main arm
+        2       Secondary arm
+        3-6     Carriage 1
+        7-10    Carriage 2
+
+    and every pair Robot.collision_check tests is intersected in one
+    broadcast, for a single state or a whole trajectory of T states.
+'''
+
+PARTS = ["main arm", "main arm", "secondary arm"] + ["carriage1"] * 4 + ["carriage2"] * 4
+
+def get_pairs():
+    ''' Returns the segment pairs tested, in the order Robot.collision_check reports them '''
+    first, second = [], []
+    for i in (0, 1):
+        for j in range(2, 11):
+            first += [i]
+            second += [j]
+    for i in range(3, 7):
+        for j in range(7, 11):
+            first += [i]
+            second += [j]
+    return np.array(first), np.array(second)
+
+PAIRS = get_pairs()
+
+def intersect(p, r, q, s):
+    '''
+    Intersects arrays of segments (..., 2) from p to p + r and from q to
+    q + s. With x the 2D cross product, u = ((q - p) x r) / (r x s) and
+    t = ((q - p) x s) / (r x s) are how far along each segment they meet.
+    True where 0 < u < 1 and 0 < t < 1, parallel segments (r x s = 0)
+    never cross.
+    '''
+    temp = q - p
+    denom = r[...,0] * s[...,1] - r[...,1] * s[...,0]
+    valid = denom != 0
+    denom = np.where(valid, denom, 1)
+    u = (temp[...,0] * r[...,1] - temp[...,1] * r[...,0]) / denom
+    t = (temp[...,0] * s[...,1] - temp[...,1] * s[...,0]) / denom
+    return valid & (u > 0) & (u < 1) & (t > 0) & (t < 1)
+
+def get_carriage_bounds(base, angle, gripper, scale):
+    '''
+    Carriage.get_collision_bounds of T carriages, from their base points
+    (T x 2), absolute angles and gripper extensions. Returns T x 4 x 2 x 2.
+    '''
+    length = global_parameters['CARRIAGE_LENGTH'] * scale
+    width = global_parameters['CARRIAGE_WIDTH'] * scale
+    rad = np.radians(angle)
+    k = np.stack([length*np.cos(rad)/2, -1 * length*np.sin(rad)/2], axis=1)
+    mag = np.sqrt(k[:,0]*k[:,0] + k[:,1]*k[:,1])
+    x = np.stack([-k[:,1] / mag, k[:,0] / mag], axis=1)
+    x1 = x * width/2
+    x2 = x * np.asarray(gripper, dtype=np.float64)[:,None] * scale
+
+    # T x 6 x 2, the rows of Carriage.points
+    points = base[:,None] + CORNER_K * k[:,None] + CORNER_X1 * x1[:,None] + CORNER_X2 * x2[:,None]
+
+    # With the gripper narrower than the carriage the body is the outline, otherwise the gripper
+    closed = np.asarray(gripper)[:,None] < global_parameters['CARRIAGE_WIDTH']
+    front = np.where(closed, points[:,0], points[:,4])
+    back = np.where(closed, points[:,3], points[:,5])
+    r1 = points[:,1] - points[:,2]
+    r2 = points[:,1] - front
+    r3 = back - points[:,2]
+    r4 = back - front
+    return np.stack([
+        np.stack([points[:,1], r3], axis=1),
+        np.stack([points[:,1], r4], axis=1),
+        np.stack([back, r1], axis=1),
+        np.stack([back, r2], axis=1)
+    ], axis=1)
+
+def get_bounds(track_pt, secondary_pt1, secondary_pt2, carriage_angle1, carriage_angle2, grippers, scale):
+    '''
+    Returns the T x 11 x 2 x 2 segments of T states, from the arrays of
+    kinematics.solve and the gripper extension of each carriage (2 x T).
+    '''
+    T = len(track_pt)
+    width = global_parameters['MAIN_ARM_WIDTH']
+    main_arm = np.empty([T, 2, 2, 2])
+    main_arm[:,:,0] = (np.asarray(track_pt) + [width, width])[:,None]
+    main_arm[:,0,1] = [0, -1000]
+    main_arm[:,1,1] = [-1000, 0]
+
+    secondary_arm = np.stack([secondary_pt1, secondary_pt2 - secondary_pt1], axis=1)[:,None]
+
+    grippers = np.broadcast_to(np.asarray(grippers, dtype=np.float64).reshape(2, -1), (2, T))
+    carriage1 = get_carriage_bounds(secondary_pt1, carriage_angle1, grippers[0], scale)
+    carriage2 = get_carriage_bounds(secondary_pt2, carriage_angle2, grippers[1], scale)
+
+    return np.concatenate([main_arm, secondary_arm, carriage1, carriage2], axis=1)
+
+def get_joint_bounds(joints, grippers, scale):
+    ''' get_bounds of the output of kinematics.solve '''
+    return get_bounds(joints['track_pt'], joints['secondary_pt1'], joints['secondary_pt2'], \
+        joints['carriage_angle1'], joints['carriage_angle2'], grippers, scale)
+
+def check(bounds):
+    '''
+    Tests every pair of segments of a state (11 x 2 x 2) or of T states
+    (T x 11 x 2 x 2). Returns the first colliding state (0 for a single
+    state) and a report of the parts, or None and "" without a collision.
+    '''
+    bounds = np.asarray(bounds, dtype=np.float64)
+    if bounds.ndim == 3:
+        bounds = bounds[None]
+    first, second = PAIRS
+    hits = intersect(bounds[:,first,0], bounds[:,first,1], bounds[:,second,0], bounds[:,second,1])
+
+    steps = np.flatnonzero(hits.any(axis=1))
+    if len(steps) == 0:
+        return None, ""
+    pair = np.argmax(hits[steps[0]])
+    return int(steps[0]), "Collision between " + PARTS[first[pair]] + " and " + PARTS[second[pair]]
@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+
+from ..global_parameters import global_parameters
+
+'''
+    Array version of Robot.move_to. Given the follow points of both
+    carriages over T steps it returns the joint state of every step, as
+    Robot.get_physical_state would after each move_to, without creating
+    any Point objects. The Robot parts are still used for drawing.
+
+    The main track only moves when the main arm cannot reach the
+    secondary arm from where the track left it (length or rotation
+    limits), so its length depends on the step before. That recurrence is
+    a short scalar loop, everything else is done on whole arrays.
+'''
+
+def vector_angle(x, y):
+    ''' Point.vector_angle of arrays of vectors, in degrees counter clockwise on screen '''
+    ret = np.degrees(np.arctan2(-y, x)) % 360
+    # Point.vector_angle treats a zero vector as pointing down
+    return np.where((x == 0) & (y == 0), 270, ret)
+
+def point_angle(x, y):
+    ''' Scalar vector_angle '''
+    if x == 0 and y == 0:
+        return 270
+    return math.degrees(math.atan2(-y, x)) % 360
+
+def clamp_track(base_y, arm_sx, arm_sy, secondary_angle, length, scale):
+    '''
+    Runs the main arm and main track follow steps. arm_sx, arm_sy are the
+    points the main arm follows (the secondary arm base) and length the
+    track length before the first step. Returns the track length, main arm
+    length and main arm angle of every step.
+    '''
+    track_min = global_parameters['MAIN_TRACK_MIN_LENGTH'] * scale
+    track_max = global_parameters['MAIN_TRACK_MAX_LENGTH'] * scale
+    arm_min = global_parameters['MAIN_ARM_MIN_LENGTH'] * scale
+    arm_max = global_parameters['MAIN_ARM_MAX_LENGTH'] * scale
+    angle_min = global_parameters['MAIN_ARM_MIN_ANGLE']
+    angle_max = global_parameters['MAIN_ARM_MAX_ANGLE']
+
+    T = len(arm_sx)
+    track_lengths = np.empty(T)
+    arm_lengths = np.empty(T)
+    arm_angles = np.empty(T)
+
+    # The main arm base is where the track left it, directly above the robot base
+    for t, (sx, sy, sa) in enumerate(zip(arm_sx.tolist(), arm_sy.tolist(), secondary_angle.tolist())):
+        dx = sx
+        dy = sy - (base_y - length)
+        mag = math.sqrt(dx*dx + dy*dy)
+        arm_length = min(max(mag, arm_min), arm_max)
+        bx = sx - dx / mag * arm_length
+        by = sy - dy / mag * arm_length
+
+        angle = (point_angle(sx - bx, sy - by) + 180) % 360
+        rel_angle = (sa - angle + 360) % 360
+        rotation = 0
+        if rel_angle < angle_min:
+            rotation = angle_min - rel_angle
+        elif rel_angle > angle_max:
+            rotation = angle_max - rel_angle
+        if rotation != 0:
+            # Point.rotate of the base about the followed point
+            r = math.radians(rotation)
+            tx, ty = bx - sx, by - sy
+            bx = tx * math.cos(r) - ty * math.sin(r) + sx
+            by = tx * math.sin(r) + ty * math.cos(r) + sy
+            angle = (point_angle(sx - bx, sy - by) + 180) % 360
+
+        length = min(max(base_y - by, track_min), track_max)
+        track_lengths[t] = length
+        arm_lengths[t] = arm_length
+        arm_angles[t] = angle
+
+    return track_lengths, arm_lengths, arm_angles
+
+def fill_angles(angles, start):
+    ''' Replaces every NaN angle with the last angle before it, start before the first '''
+    angles = np.asarray(angles, dtype=np.float64)
+    valid = ~np.isnan(angles)
+    index = np.maximum.accumulate(np.where(valid, np.arange(len(angles)), -1))
+    return np.where(index >= 0, angles[np.maximum(index, 0)], start)
+
+def solve(pts1, pts2, base_pt, scale, track_length, start_angles=(0, 0), grippers=(0.5, 0.5), downwards=(0, 0)):
+    '''
+    Returns the joints of the robot for T steps of follow points.
+
+    pts1, pts2 are T x 3 arrays of (x, y, angle) for each carriage, a NaN
+    angle keeps the carriage angle of the step before (start_angles before
+    the first). base_pt is the robot base (x, y) and track_length the main
+    track length in px before the first step. grippers and downwards hold
+    the gripper and downward extension of each carriage, either a value or
+    an array of T.
+
+    Returns a dictionary of
+        state           T x 12 array, the columns of Robot.get_physical_state
+        track_length    T main track length in px
+        track_pt        T x 2 end of the main track (main arm base)
+        main_arm_pt     T x 2 end of the main arm (secondary arm base)
+        secondary_pt1   T x 2 carriage 1 base
+        secondary_pt2   T x 2 carriage 2 base
+        secondary_angle T absolute secondary arm angle
+        carriage_angle1 T absolute carriage 1 angle
+        carriage_angle2 T absolute carriage 2 angle
+    '''
+    pts1 = np.asarray(pts1, dtype=np.float64)
+    pts2 = np.asarray(pts2, dtype=np.float64)
+    base_x, base_y = float(base_pt[0]), float(base_pt[1])
+    T = len(pts1)
+
+    # Secondary arm, centered between the follow points
+    d = pts1[:,0:2] - pts2[:,0:2]
+    half = np.sqrt(d[:,0]*d[:,0] + d[:,1]*d[:,1]) / 2
+    secondary_length = np.clip(half, global_parameters['SECONDARY_ARM_MIN_LENGTH'] * scale, global_parameters['SECONDARY_ARM_MAX_LENGTH'] * scale)
+    secondary_angle = vector_angle(d[:,0], d[:,1])
+    center = pts1[:,0:2] - d / 2
+
+    # Main arm and main track, relative to the base x
+    track_lengths, arm_lengths, arm_angles = clamp_track(base_y, center[:,0] - base_x, center[:,1], secondary_angle, track_length, scale)
+
+    # Parts are moved back onto the constrained chain, rounding like Robot.move_to
+    track_pt = np.stack([np.full(T, base_x), base_y - track_lengths], axis=1)
+    arm_rad = np.radians(arm_angles)
+    main_arm_pt = np.round(np.stack([track_pt[:,0] - arm_lengths * np.cos(arm_rad), track_pt[:,1] + arm_lengths * np.sin(arm_rad)], axis=1))
+    sec_rad = np.radians(secondary_angle)
+    offset = np.stack([secondary_length * np.cos(sec_rad), -secondary_length * np.sin(sec_rad)], axis=1)
+    secondary_pt1 = np.round(main_arm_pt + offset)
+    secondary_pt2 = np.round(main_arm_pt - offset)
+
+    carriage_angle1 = fill_angles(pts1[:,2], start_angles[0])
+    carriage_angle2 = fill_angles(pts2[:,2], start_angles[1])
+
+    state = np.empty([T, 12])
+    state[:,0] = track_lengths / scale
+    state[:,1] = arm_lengths / scale
+    state[:,2] = arm_angles
+    state[:,3] = secondary_length / scale
+    state[:,4] = secondary_length / scale
+    state[:,5] = (secondary_angle - arm_angles + 360 + 180) % 360
+    state[:,6] = (carriage_angle1 - secondary_angle + 360 + 180) % 360
+    state[:,7] = grippers[0]
+    state[:,8] = downwards[0]
+    state[:,9] = (carriage_angle2 - secondary_angle + 360 + 180) % 360
+    state[:,10] = grippers[1]
+    state[:,11] = downwards[1]
+
+    return {
+        "state" : state,
+        "track_length" : track_lengths,
+        "track_pt" : track_pt,
+        "main_arm_pt" : main_arm_pt,
+        "secondary_pt1" : secondary_pt1,
+        "secondary_pt2" : secondary_pt2,
+        "secondary_angle" : secondary_angle,
+        "carriage_angle1" : carriage_angle1,
+        "carriage_angle2" : carriage_angle2
+    }
@@ -4,6 +4,9 @@ import cv2
 import numpy as np
 
 class Point:
+    # No per instance __dict__, the model creates and drops points every step
+    __slots__ = ("x", "y", "angle", "steps_remaining", "update_vec", "delay")
+
     def __init__(self, x, y, angle=None, steps=0, vec=None):
         self.x = x
         self.y = y
@@ -19,16 +22,40 @@ class Point:
         ret += ")"
         return ret
 
+    def __getstate__(self):
+        return {name : getattr(self, name) for name in self.__slots__}
+    def __setstate__(self, state):
+        # Configuration files pickled before __slots__ hold the instance __dict__
+        self.delay = 0
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __add__(self, other):
-        return Point(self.x + other.x, self.y + other.y, angle=self.angle, steps=self.steps_remaining, vec=self.update_vec)
+        return Point(self.x + other.x, self.y + other.y, self.angle, self.steps_remaining, self.update_vec)
     def __sub__(self, other):
-        return Point(self.x - other.x, self.y - other.y, angle=self.angle, steps=self.steps_remaining, vec=self.update_vec)
+        return Point(self.x - other.x, self.y - other.y, self.angle, self.steps_remaining, self.update_vec)
     def __mul__(self, factor):
-        return Point(self.x * factor, self.y * factor, angle=self.angle, steps=self.steps_remaining, vec=self.update_vec)
+        return Point(self.x * factor, self.y * factor, self.angle, self.steps_remaining, self.update_vec)
     def __truediv__(self, factor):
-        return Point(self.x / factor, self.y / factor, angle=self.angle, steps=self.steps_remaining, vec=self.update_vec)
+        return Point(self.x / factor, self.y / factor, self.angle, self.steps_remaining, self.update_vec)
     def __floordiv__(self, factor):
-        return Point(self.x // factor, self.y // factor, angle=self.angle, steps=self.steps_remaining, vec=self.update_vec)
+        return Point(self.x // factor, self.y // factor, self.angle, self.steps_remaining, self.update_vec)
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+    def __imul__(self, factor):
+        self.x *= factor
+        self.y *= factor
+        return self
+    def __itruediv__(self, factor):
+        self.x /= factor
+        self.y /= factor
+        return self
     def __eq__(self, other):
         if self.x == other.x and self.y == other.y and self.angle == other.angle:
             return True
@@ -36,9 +63,10 @@ class Point:
             return False
 
     def mag(self):
-        return (self.x**2 + self.y**2)**0.5
+        return math.sqrt(self.x*self.x + self.y*self.y)
     def norm(self):
-        return Point(self.x / self.mag(), self.y / self.mag(), angle=self.angle, steps=self.steps_remaining, vec=self.update_vec)
+        mag = self.mag()
+        return Point(self.x / mag, self.y / mag, self.angle, self.steps_remaining, self.update_vec)
     def vector_angle(self):
         if self.x < 0:
             return (math.degrees(math.atan((-1*self.y)/self.x)) + 180 + 360) % 360
@@ -50,18 +78,13 @@ class Point:
         else:
             return (math.degrees(math.atan((-1*self.y)/self.x)) + 360) % 360
     def rotate(self, angle, ref_pt):
-        temp = Point(self.x, self.y)
-        temp -= ref_pt
+        x = self.x - ref_pt.x
+        y = self.y - ref_pt.y
 
         angle_r = math.radians(angle)
 
-        ret = Point(temp.x * math.cos(angle_r) - temp.y * math.sin(angle_r), 
-           temp.x * math.sin(angle_r) + temp.y * math.cos(angle_r))
-
-        ret += ref_pt
-        
-        self.x = ret.x
-        self.y = ret.y
+        self.x = x * math.cos(angle_r) - y * math.sin(angle_r) + ref_pt.x
+        self.y = x * math.sin(angle_r) + y * math.cos(angle_r) + ref_pt.y
 
     def draw(self, canvas, color=(0, 0, 255), size=3):
         cv2.circle(canvas, self.to_tuple(), size, color)
@@ -71,11 +94,11 @@ class Point:
         return (int(round(self.x)), int(round(self.y)))
     def to_array(self):
         return np.array([self.x, self.y])
+    # Names used by the older parts of the model
+    toTuple = to_tuple
+    toArray = to_array
     def copy(self):
-        ret = Point(self.x, self.y, angle=self.angle)
-        ret.steps_remaining = self.steps_remaining
-        ret.update_vec = self.update_vec
-        return ret
+        return Point(self.x, self.y, self.angle, self.steps_remaining, self.update_vec)
 
 
     def set_heading(self, otherPt, dt, delay=0):
@@ -108,4 +131,64 @@ class Point:
             if self.steps_remaining <= 1:
                 return False
             return True
-        return False
\ No newline at end of file
+        return False
+
+class PointArray:
+    '''
+        A batch of points held as an N x 3 float array of (x, y, angle), a NaN
+        angle being a point without one. Indexing gives a Point, so it stands
+        in for a list of Points such as PHASE_3_PATH1 or a PathFinder path.
+        Whole path operations work on the array instead of point by point.
+    '''
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = np.asarray(data, dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def from_points(cls, points):
+        return cls([[pt.x, pt.y, np.nan if pt.angle is None else pt.angle] for pt in points])
+
+    def __repr__(self):
+        return "PointArray(" + ", ".join(str(pt) for pt in self) + ")"
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PointArray(self.data[index])
+        x, y, angle = self.data[index].tolist()
+        return Point(x, y, angle=None if math.isnan(angle) else angle)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self.data)))
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __getstate__(self):
+        return self.data
+    def __setstate__(self, state):
+        self.data = state
+
+    def to_points(self):
+        return list(self)
+
+    def to_array(self):
+        return self.data[:,0:2].copy()
+
+    def get_angles(self):
+        return self.data[:,2]
+
+    def set_angles(self, angles):
+        self.data[:,2] = angles
+
+    def mags(self):
+        ''' Length of each segment between consecutive points '''
+        d = np.diff(self.data[:,0:2], axis=0)
+        return np.sqrt(d[:,0]*d[:,0] + d[:,1]*d[:,1])
+
+    def draw(self, canvas, color=(0, 0, 255), size=3):
+        for pt in self:
+            pt.draw(canvas, color=color, size=size)
@@ -9,6 +9,9 @@ from .main_track import MainTrack
 from .main_arm import MainArm 
 from .secondary_arm import SecondaryArm
 from .carriage import Carriage
+from . import kinematics
+from . import collision
+from . import trajectory
 from ..global_parameters import global_parameters
 
 class Robot:
@@ -17,8 +20,9 @@ class Robot:
     ### Basic Functions ###
     #######################
 
-    def __init__(self, robot_base_pt, scale):
+    def __init__(self, robot_base_pt, scale, viewer=None):
         self.scale = scale
+        self.viewer = viewer # Shown every step if set, otherwise the simulation runs headless
 
         # Initializes robot parts 
         self.base_pt = robot_base_pt
@@ -42,6 +46,7 @@ class Robot:
         self.xs = []
         self.acc_data = []
         self.vel_data = []
+        self.trajectory = [] # Model state of every recorded step, see RobotViewer.play
         self.recording = False
 
     def __repr__(self):
@@ -65,6 +70,7 @@ class Robot:
         self.xs = []
         self.acc_data = []
         self.vel_data = []
+        self.trajectory = []
 
     def get_physical_state(self):
         ret = []
@@ -86,6 +92,7 @@ class Robot:
 
     def clear_history(self):
         self.profile_data = []
+        self.trajectory = []
 
     def get_data(self):
         return self.xs, self.profile_data, self.vel_data
@@ -214,47 +221,11 @@ class Robot:
 
         '''
 
-        # Gather all relevant vectors 
-        main_arm = self.main_arm.get_collision_bounds()
-        secondary_arm = self.secondary_arm.get_collision_bounds()
-        carriage1 = self.carriage1.get_collision_bounds()
-        carriage2 = self.carriage2.get_collision_bounds()
-
-        for i in range(0, len(main_arm)):
-            # Check collision between secondary arm and main arm 
-            for j in range(0, len(secondary_arm)):
-                if self.check_vector_intersect(main_arm[i][0], main_arm[i][1], secondary_arm[j][0], secondary_arm[j][1]):
-                    return True, "Collision between main arm and secondary arm"
-            # Check collision between carriage1 and main arm
-            for j in range(0, len(carriage1)):
-                if self.check_vector_intersect(main_arm[i][0], main_arm[i][1], carriage1[j][0], carriage1[j][1]):
-                    return True, "Collision between main arm and carriage1"
-            # Check collision between carriage2 and main arm
-            for j in range(0, len(carriage2)):
-                if self.check_vector_intersect(main_arm[i][0], main_arm[i][1], carriage2[j][0], carriage2[j][1]):
-                    return True, "Collision between main arm and carriage2"
-        # Check collisions between carriages
-        for i in range(0, len(carriage1)):
-            for j in range(0, len(carriage2)):
-                if self.check_vector_intersect(carriage1[i][0], carriage1[i][1], carriage2[j][0], carriage2[j][1]):
-                    return True, "Collision between carriage1 and carriage2"
-            
-        return False, ""
-
-    def check_vector_intersect(self, p, r, q, s):
-        temp1 = np.subtract(q, p)
-        temp2 = np.cross(r, s)
-
-        if temp2 == 0:
-            return False
-
-        u = np.cross(temp1, r) / temp2
-        t = np.cross(temp1, s) / temp2
-
-        if u <= 0 or u >= 1 or t <= 0 or t >= 1:
-            return False
-
-        return True
+        # Gather all relevant vectors, see collision.py for the pairs tested
+        bounds = self.main_arm.get_collision_bounds() + self.secondary_arm.get_collision_bounds() + \
+            self.carriage1.get_collision_bounds() + self.carriage2.get_collision_bounds()
+        step, report = collision.check(bounds)
+        return step is not None, report
 
     def move_to(self, pt1, pt2):
         # First moves all the components to the desired points
@@ -271,6 +242,19 @@ class Robot:
         self.carriage1.move_base(self.secondary_arm.other_pt1, self.secondary_arm.angle)
         self.carriage2.move_base(self.secondary_arm.other_pt2, self.secondary_arm.angle)
 
+    def solve_kinematics(self, pts1, pts2, grippers=None, downwards=None):
+        '''
+        Returns the joints for arrays of (x, y, angle) follow points starting
+        from the current state, as move_to would reach them step by step,
+        without moving the model. See kinematics.solve.
+        '''
+        if grippers is None:
+            grippers = (self.carriage1.gripper_extension, self.carriage2.gripper_extension)
+        if downwards is None:
+            downwards = (self.carriage1.downward_extension, self.carriage2.downward_extension)
+        return kinematics.solve(pts1, pts2, (self.base_pt.x, self.base_pt.y), self.scale, self.main_track.length, \
+            start_angles=(self.carriage1.angle, self.carriage2.angle), grippers=grippers, downwards=downwards)
+
     def follow_path(self, path1, path2, execution_time):
         self.follow1_index = 0
         self.follow2_index = 0
@@ -278,20 +262,7 @@ class Robot:
         self.path1 = path1
         self.path2 = path2
 
-        self.dt1 = []
-        for i in range(0, len(path1)-1):
-            self.dt1 += [(path1[i + 1] - path1[i]).mag()]
-        self.dt2 = []
-        for i in range(0, len(path2)-1):
-            self.dt2 += [(path2[i + 1] - path2[i]).mag()]
-
-        dt1_sum = np.sum(self.dt1)
-        dt2_sum = np.sum(self.dt2)
-
-        longest = max(dt1_sum, dt2_sum)
-
-        self.dt1 = np.divide(np.multiply(self.dt1, execution_time), longest)
-        self.dt2 = np.divide(np.multiply(self.dt2, execution_time), longest)
+        self.dt1, self.dt2 = trajectory.get_path_times(path1, path2, execution_time)
 
     def update(self):
         self.counter += 1
@@ -424,10 +395,8 @@ class Robot:
 
         self.move_to(self.follow_pt1, self.follow_pt2)
 
-        frame = np.zeros([1200, 1200, 3])
-        self.draw(frame)
-        cv2.imshow("Temp", frame)
-        cv2.waitKey(0)
+        if self.viewer is not None:
+            self.viewer.show(self)
 
         flag, report = self.collision_check()
         if flag:
@@ -442,6 +411,7 @@ class Robot:
 
         if self.recording:
             self.profile_data += [self.get_physical_state()]
+            self.trajectory += [self.get_model_state()]
             if self.phase == 0: # This only ever hits immediately after phase 6
                 self.profile_data += [self.get_physical_state()]
                 self.profile_data += [self.get_physical_state()]
@@ -470,8 +440,59 @@ class Robot:
 
         self.recording = False
 
+    def plan(self, read_time, dist):
+        '''
+        Array version of run for the pick set up by move_meat. The follow
+        points of every step come from trajectory.build_pick and the joints
+        from solve_kinematics, giving the same xs and profile_data as run.
+        Every step is checked for collisions at once, steps are not drawn.
+        The model is left where run leaves it. Returns False if the path
+        collides, after resetting the model like update.
+        '''
+        self.clear_history()
+        timeline = trajectory.build_pick(self)
+        joints = self.solve_kinematics(timeline['pts1'], timeline['pts2'], timeline['grippers'], timeline['downwards'])
+        start = self.get_physical_state()
+        count = len(joints['state'])
+
+        step, report = collision.check(collision.get_joint_bounds(joints, timeline['grippers'], self.scale))
+        if step is not None:
+            print("ERROR: Profile resulted in collision.")
+            print(report)
+            self.scrap_data()
+            self.set_model_state(self.backup_state)
+            return False
+
+        # The last step is run on the model from the joints of the one before
+        if count > 1:
+            self.main_track.length = joints['track_length'][-2]
+            self.main_track.other_pt = self.main_track.get_other_pt()
+            self.main_arm.base_pt = self.main_track.other_pt
+            self.carriage1.angle = joints['carriage_angle1'][-2]
+            self.carriage2.angle = joints['carriage_angle2'][-2]
+        self.carriage1.gripper_extension, self.carriage2.gripper_extension = timeline['grippers'][:,-1]
+        self.carriage1.downward_extension, self.carriage2.downward_extension = timeline['downwards'][:,-1]
+        self.follow_pt1 = Point(*timeline['pts1'][-1][0:2], angle=None if np.isnan(timeline['pts1'][-1][2]) else timeline['pts1'][-1][2])
+        self.follow_pt2 = Point(*timeline['pts2'][-1][0:2], angle=None if np.isnan(timeline['pts2'][-1][2]) else timeline['pts2'][-1][2])
+        self.follow_pt1.set_heading(self.follow_pt1, 1)
+        self.follow_pt2.set_heading(self.follow_pt2, 1)
+        self.move_to(self.follow_pt1, self.follow_pt2)
+
+        self.phase = 0
+        self.switched = True
+        self.counter += count + 1
+        self.phase_1_counter = timeline['phase_1_counter']
+
+        states = joints['state'].tolist()
+        self.profile_data = [start, start] + states + [states[-1], states[-1]]
+        self.trajectory = joints['state'][:,[0, 1, 2, 3, 4, 5, 6, 8, 7, 9, 11, 10]].tolist()
+
+        # c accounts for the time after the robot has moved into position but before it grabs the meat
+        c = (dist / global_parameters['CONVEYOR_SPEED'] - self.phase_1_counter) / global_parameters['FRAME_RATE']
+        self.xs = [read_time + (i - 2) / global_parameters['FRAME_RATE'] + c for i in range(0, count + 4)]
+        return True
+
     def set_model_state(self, state):
-        print("MODEL BACK UPPED")
         '''
         Using a list of the parameters required to fully define the robot, 
         set the robot parameters using to match the given state. 
@@ -533,6 +554,7 @@ class Robot:
         self.xs = []
         self.acc_data = []
         self.vel_data = []
+        self.trajectory = []
         self.recording = False
 
     def get_model_state(self):
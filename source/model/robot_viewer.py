@@ -0,0 +1,49 @@
+import time
+
+import cv2
+import numpy as np
+
+from .robot import Robot
+from ..global_parameters import global_parameters
+
+class RobotViewer:
+    '''
+        Draws a Robot outside of its simulation, which otherwise runs
+        headless. Passed as the viewer of a Robot it shows every simulated
+        step as it happens. play instead replays a recorded trajectory
+        (Robot.trajectory, kept while a path is recorded) on a model of its
+        own, so planning never waits on drawing.
+
+        Frames are shown at rate frames/s (defaults to FRAME_RATE), a rate
+        of 0 waits for a key press on every frame.
+    '''
+    def __init__(self, robot_base_pt, scale, rate=None, shape=(1200, 1200), window="Robot"):
+        if rate is None:
+            rate = global_parameters['FRAME_RATE']
+
+        self.model = Robot(robot_base_pt, scale)
+        self.rate = rate
+        self.window = window
+        self.canvas = np.zeros([shape[0], shape[1], 3], dtype=np.uint8)
+        self.last_shown = 0
+
+    def show(self, robot):
+        ''' Draws robot and waits out the rest of the frame. Returns False if q was pressed. '''
+        self.canvas[...] = 0
+        robot.draw(self.canvas)
+        cv2.imshow(self.window, self.canvas)
+
+        if self.rate <= 0:
+            key = cv2.waitKey(0)
+        else:
+            remaining = 1 / self.rate - (time.time() - self.last_shown)
+            key = cv2.waitKey(max(int(remaining * 1000), 1))
+        self.last_shown = time.time()
+        return key & 0xFF != ord('q')
+
+    def play(self, trajectory):
+        ''' Replays a list of model states (see Robot.get_model_state), stopping if q is pressed '''
+        for state in trajectory:
+            self.model.set_model_state(state)
+            if not self.show(self.model):
+                break
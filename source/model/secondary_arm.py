@@ -94,4 +94,4 @@ class SecondaryArm:
             4: Angle
         '''
         angle = (state[4] + state[1] + 180 + 720) % 360
-        self.__init__(state[0], self.scale, length1=state[2], length2=state[3], angle=angle, relative_angle=state[1])
\ No newline at end of file
+        self.__init__(state[0], self.scale, length1=state[2], length2=state[3], angle=angle, relative_angle=state[4])
\ No newline at end of file
@@ -0,0 +1,224 @@
+import math
+
+import numpy as np
+
+from .point import PointArray
+from ..global_parameters import global_parameters
+
+'''
+    Closed form version of the Robot.update phase machine. Rather than
+    stepping the follow points one frame at a time, the step each phase
+    ends on is worked out from its speed, delay and follow_path timings,
+    and every heading is expanded into the positions it passes through in
+    one array operation. build_pick returns the follow points and carriage
+    extensions of a whole pick, ready for kinematics.solve.
+
+    Headings are summed in the same order Point.update adds them, so the
+    timeline matches stepping Robot.update exactly. A step is one call of
+    Robot.update that moves the robot, the first is step 1.
+'''
+
+def get_moves(dt):
+    ''' Number of Point.update calls that move a point after set_heading(pt, dt) '''
+    return math.ceil(dt - 1) if dt > 1 else 0
+
+def get_path_times(path1, path2, execution_time):
+    ''' Returns the steps between the waypoints of two paths, the longest path taking execution_time '''
+    dt1 = PointArray.from_points(path1).mags()
+    dt2 = PointArray.from_points(path2).mags()
+
+    longest = max(np.sum(dt1), np.sum(dt2))
+
+    dt1 = np.divide(np.multiply(dt1, execution_time), longest)
+    dt2 = np.divide(np.multiply(dt2, execution_time), longest)
+    return dt1, dt2
+
+class FollowTimeline:
+    '''
+        Headings of one follow point, each set on a step and holding the
+        (x, y, angle) the point passes through. A NaN angle is a point
+        without an angle.
+    '''
+    def __init__(self, pt):
+        self.headings = []
+        angle = np.nan if pt.angle is None else pt.angle
+        if pt.update_vec is None:
+            self.add(0, pt.x, pt.y, angle, 0, 0, 0, 0)
+        else:
+            self.add(0, pt.x, pt.y, angle, pt.update_vec.x, pt.update_vec.y, pt.update_vec.angle, pt.steps_remaining)
+
+    def add(self, step, x, y, angle, dx, dy, da, dt):
+        moves = get_moves(dt)
+        start = np.array([[x, y, angle]], dtype=np.float64)
+        vec = np.tile(np.array([dx, dy, da], dtype=np.float64), (moves, 1))
+        self.headings += [(step, np.add.accumulate(np.concatenate([start, vec]), axis=0))]
+        return moves
+
+    def position(self, step):
+        ''' Returns the (x, y, angle) of the point after the given step '''
+        set_at, pts = self.headings[-1]
+        return pts[min(step - set_at, len(pts) - 1)]
+
+    def set_heading(self, step, x, y, angle, dt):
+        ''' Point.set_heading on the given step, returns the number of steps the point moves for '''
+        px, py, pa = self.position(step)
+        dx = (x - px)/dt
+        dy = (y - py)/dt
+        da = 0
+        if not np.isnan(pa) and angle is not None:
+            temp = angle - pa
+            if temp > 180:
+                da = -1*(360 - temp)/dt
+            elif temp < -180:
+                da = -1*(360 + temp)/dt
+            else:
+                da = temp/dt
+        return self.add(step, px, py, pa, dx, dy, da, dt)
+
+    def set_target(self, step, pt, dt):
+        return self.set_heading(step, pt.x, pt.y, pt.angle, dt)
+
+    def stop(self, step):
+        ''' set_heading to itself with dt 1, the point stays where it is '''
+        self.add(step, *self.position(step), 0, 0, 0, 1)
+
+    def follow_path(self, step, path, dt):
+        '''
+        Moves through path[1:] from the given step, a waypoint each time
+        the point stops, like the follow index of Robot.update. Returns the
+        step the point reaches the last waypoint on.
+        '''
+        for i in range(1, len(path)):
+            step += max(self.set_target(step, path[i], dt[i - 1]), 1)
+        return step
+
+    def emit(self, count):
+        ''' Returns a count x 3 array of the point after each step '''
+        ret = np.empty([count, 3])
+        for i, (set_at, pts) in enumerate(self.headings):
+            end = self.headings[i + 1][0] if i + 1 < len(self.headings) else count + 1
+            steps = np.arange(max(set_at, 1), min(end, count + 1))
+            ret[steps - 1] = pts[np.minimum(steps - set_at, len(pts) - 1)]
+        return ret
+
+def ramp(value, step, count, limit):
+    ''' Carriage.lower/open (step > 0) or lift (step < 0) run count times from value '''
+    if (value - limit) * step >= 0:
+        return np.full(count, value, dtype=np.float64)
+    ret = np.add.accumulate(np.concatenate([[value], np.full(count, step)]))[1:]
+    return np.minimum(ret, limit) if step > 0 else np.maximum(ret, limit)
+
+def close(value, width, count):
+    ''' Carriage.close(width) run count times from value '''
+    if value <= width:
+        return np.full(count, value, dtype=np.float64)
+    step = global_parameters['GRIPPER_SPEED'] / global_parameters['FRAME_RATE']
+    ret = np.add.accumulate(np.concatenate([[value], np.full(count, -step)]))[1:]
+    ret = np.maximum(ret, global_parameters['GRIPPER_MIN_EXTENSION'])
+    closed = np.flatnonzero(ret <= width)
+    if len(closed) > 0:
+        ret[closed[0]:] = ret[closed[0]]
+    return ret
+
+def get_extensions(carriage, width, grab, release, count):
+    '''
+    Returns the gripper and downward extension of a carriage after each step,
+    closing and lowering from step grab[0] to grab[1] and opening and lifting
+    from release[0] to release[1]
+    '''
+    grip_speed = global_parameters['GRIPPER_SPEED'] / global_parameters['FRAME_RATE']
+    down_speed = global_parameters['DOWNWARD_SPEED'] / global_parameters['FRAME_RATE']
+    gripper = np.full(count + 1, carriage.gripper_extension, dtype=np.float64)
+    downward = np.full(count + 1, carriage.downward_extension, dtype=np.float64)
+
+    n = grab[1] - grab[0] + 1
+    g = close(gripper[0], width, n)
+    d = ramp(downward[0], down_speed, n, global_parameters['DOWNWARD_MAX_EXTENSION'])
+    gripper[grab[0]:grab[1] + 1], gripper[grab[1] + 1:] = g, g[-1]
+    downward[grab[0]:grab[1] + 1], downward[grab[1] + 1:] = d, d[-1]
+
+    n = release[1] - release[0] + 1
+    g = ramp(g[-1], grip_speed, n, global_parameters['GRIPPER_MAX_EXTENSION'])
+    d = ramp(d[-1], -down_speed, n, global_parameters['DOWNWARD_MIN_EXTENSION'])
+    gripper[release[0]:release[1] + 1], gripper[release[1] + 1:] = g, g[-1]
+    downward[release[0]:release[1] + 1], downward[release[1] + 1:] = d, d[-1]
+
+    return gripper[1:], downward[1:]
+
+def build_pick(robot):
+    '''
+    Returns the timeline of the pick set up by robot.move_meat as a
+    dictionary of
+        pts1, pts2          K x 3 (x, y, angle) follow points, NaN for no angle
+        grippers            2 x K gripper extension of each carriage
+        downwards           2 x K downward extension of each carriage
+        phases              K phase the robot is in after each step
+        ends                Step each of phases 1 to 6 ends on
+        phase_1_counter     Robot.phase_1_counter at the end of the pick
+    K is the number of steps Robot.run records. The robot is not changed.
+    '''
+    pt1 = FollowTimeline(robot.follow_pt1)
+    pt2 = FollowTimeline(robot.follow_pt2)
+
+    # Phase 1: Moving to predicted meat location
+    step = 1
+    moves = max(pt1.set_target(step, robot.s1, global_parameters['PHASE_1_SPEED']), \
+        pt2.set_target(step, robot.s2, global_parameters['PHASE_1_SPEED']))
+    if robot.PHASE_1_DELAY:
+        # Delay is counted down from the first step and must fall below 1
+        moves = max(moves, math.floor(robot.delay - 2) + 1)
+    end1 = step + moves
+    phase_1_counter = end1 - step
+
+    # Phase 2: Grabbing (Follow meat)
+    step = end1
+    delay = global_parameters['PHASE_2_DELAY']
+    for pt in (pt1, pt2):
+        x, y, angle = pt.position(step)
+        pt.set_heading(step, x + 0, y + delay * global_parameters['CONVEYOR_SPEED'], None if np.isnan(angle) else angle, delay)
+    end2 = step + max(0, math.ceil(delay - 1))
+
+    # Phase 3: Rotating meat according to pre-set path
+    step = end2
+    path1, path2 = global_parameters['PHASE_3_PATH1'], global_parameters['PHASE_3_PATH2']
+    dt1, dt2 = get_path_times(path1, path2, global_parameters['PHASE_3_SPEED'])
+    # The second waypoint is set on the step the first is reached, even if that is this one
+    first1 = step + pt1.set_target(step, path1[0], global_parameters['PHASE_3_INITIAL_SPEED'])
+    first2 = step + pt2.set_target(step, path2[0], global_parameters['PHASE_3_INITIAL_SPEED'])
+    end3 = max(pt1.follow_path(first1, path1, dt1), pt2.follow_path(first2, path2, dt2))
+    pt1.stop(end3)
+    pt2.stop(end3)
+
+    # Phase 4: Extending
+    step = end3
+    end4 = step + max(pt1.set_target(step, robot.e1, global_parameters['PHASE_4_SPEED']), \
+        pt2.set_target(step, robot.e2, global_parameters['PHASE_4_SPEED']))
+
+    # Phase 5: Releasing
+    step = end4
+    end5 = step + max(0, math.ceil(global_parameters['PHASE_5_DELAY']))
+
+    # Phase 6: Moving to "Ready Position", carriage 2 waiting on the delay
+    step = end5
+    delay = round(np.sum(dt1))//3
+    path1, path2 = global_parameters['PHASE_6_PATH1'], global_parameters['PHASE_6_PATH2']
+    dt1, dt2 = get_path_times(path1, path2, global_parameters['PHASE_6_SPEED'] - delay)
+    start2 = step + max(0, math.ceil(delay)) if len(path2) > 1 else step
+    end6 = max(pt1.follow_path(step, path1, dt1), pt2.follow_path(start2, path2, dt2))
+    pt1.stop(end6)
+    pt2.stop(end6)
+
+    count = end6
+    ends = [end1, end2, end3, end4, end5, end6]
+    grip1, down1 = get_extensions(robot.carriage1, robot.meat1_width, (end1, end2), (end4, end5), count)
+    grip2, down2 = get_extensions(robot.carriage2, robot.meat2_width, (end1, end2), (end4, end5), count)
+
+    return {
+        "pts1" : pt1.emit(count),
+        "pts2" : pt2.emit(count),
+        "grippers" : np.stack([grip1, grip2]),
+        "downwards" : np.stack([down1, down2]),
+        "phases" : (np.searchsorted(ends, np.arange(1, count + 1), side="right") + 1) % 7,
+        "ends" : ends,
+        "phase_1_counter" : phase_1_counter
+    }
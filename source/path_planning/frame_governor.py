@@ -0,0 +1,108 @@
+import time
+
+from ..global_parameters import global_parameters
+
+class FrameGovernor:
+    '''
+        Keeps frame processing inside the frame budget (1 / FRAME_RATE) by
+        trading vision quality for time. Each entry of GOVERNOR_LEVELS
+        overrides some vision parameters, every level being cheaper than the
+        one before it, and level 0 ({}) runs with the configured values.
+
+        Stages of a frame are timed with start_frame, mark and end_frame, 
+        only the stages the levels make cheaper (scale and detect) count 
+        towards the frame time. If the smoothed frame time goes over the 
+        upper GOVERNOR_HEADROOM fraction of the budget the next level is 
+        used, and once it has stayed under the lower fraction for 
+        GOVERNOR_PATIENCE frames the previous one is restored. After a level
+        change no other is made until the smoothed time has settled on the
+        new level's frames.
+    '''
+    def __init__(self, budget=None, levels=None, smoothing=0.2, stages=("scale", "detect")):
+        if budget is None:
+            budget = 1 / global_parameters['FRAME_RATE']
+        if levels is None:
+            levels = global_parameters['GOVERNOR_LEVELS']
+
+        self.budget = budget
+        self.levels = levels
+        self.smoothing = smoothing
+        self.stages = stages
+        self.level = 0
+        self.calm_frames = 0
+        # Frames left before the level may change again, the first frames are warm up
+        self.settle = int(round(2 / smoothing))
+        self.hold_frames = self.settle
+
+        self.frames = 0
+        self.overruns = 0
+        self.frame_time = None # Smoothed
+        self.stage_times = {} # Smoothed
+        self.frame_start = 0
+        self.last_mark = 0
+        self.governed_time = 0 # Of the current frame
+
+    def __repr__(self):
+        ret = "FrameGovernor Object\n\tLevel: " + str(self.level) + "\n\tOverruns: " + str(self.overruns) + " of " + str(self.frames)
+        for stage, t in self.stage_times.items():
+            ret += "\n\t" + stage + ": " + str(round(t * 1000, 3)) + "ms"
+        return ret
+
+    def get(self, key):
+        ''' Returns a vision parameter at the current level '''
+        return self.levels[self.level].get(key, global_parameters[key])
+
+    def smooth(self, old, new):
+        if old is None:
+            return new
+        return old + self.smoothing * (new - old)
+
+    def start_frame(self):
+        self.frame_start = time.perf_counter()
+        self.last_mark = self.frame_start
+        self.governed_time = 0
+
+    def mark(self, stage):
+        ''' Ends a stage of the current frame '''
+        now = time.perf_counter()
+        self.stage_times[stage] = self.smooth(self.stage_times.get(stage), now - self.last_mark)
+        if stage in self.stages:
+            self.governed_time += now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self):
+        ''' Records the frame time and changes level if needed. Returns the level for the next frame. '''
+        if time.perf_counter() - self.frame_start > self.budget:
+            self.overruns += 1
+        self.frame_time = self.smooth(self.frame_time, self.governed_time)
+        self.frames += 1
+
+        if self.hold_frames > 0:
+            self.hold_frames -= 1
+            return self.level
+
+        low, high = global_parameters['GOVERNOR_HEADROOM']
+        if self.frame_time > high * self.budget:
+            if self.level < len(self.levels) - 1:
+                self.level += 1
+                self.hold_frames = self.settle
+            self.calm_frames = 0
+        elif self.frame_time < low * self.budget:
+            self.calm_frames += 1
+            if self.calm_frames >= global_parameters['GOVERNOR_PATIENCE'] and self.level > 0:
+                self.level -= 1
+                self.hold_frames = self.settle
+                self.calm_frames = 0
+        else:
+            self.calm_frames = 0
+
+        return self.level
+
+    def get_metrics(self):
+        return {
+            "level" : self.level,
+            "frames" : self.frames,
+            "overruns" : self.overruns,
+            "frame_ms" : 0 if self.frame_time is None else self.frame_time * 1000,
+            "stage_ms" : {stage : t * 1000 for stage, t in self.stage_times.items()}
+        }
@@ -1,10 +1,12 @@
-import time
 
 import numpy as np 
 import cv2
 
 from ..vision_identification import bounding_box
 from ..vision_identification import meat
+from ..vision_identification.detection_gate import DetectionGate
+from ..vision_identification.meat_tracker import MeatTracker
+from .frame_governor import FrameGovernor
 from ..model.robot import Robot
 from ..model.point import Point
 from ..global_parameters import global_parameters
@@ -13,53 +15,269 @@ class FrameHandler:
     def __init__(self):
         self.flip_flop = False # False = Left, True = Right 
         self.meats = []
+        self.meat_times = [] # Capture time of the frame each meat was found on
+
+        # Every piece admitted, kept until it leaves the band so it is not admitted twice
+        self.admitted = MeatTracker()
+        self.admitted_time = None
+        self.results = [] # (xs, vels) of every path made and not yet taken by get_results
         self.constants = []
         self.end_pt1 = global_parameters['END_POINT_1'] - Point(global_parameters['LOIN_WIDTH'] * global_parameters['VIDEO_SCALE'], 0)
         self.end_pt2 = global_parameters['END_POINT_2'] + Point(global_parameters['LOIN_WIDTH'] * global_parameters['VIDEO_SCALE'], 0)
 
         self.dt = None
         self.start = 0
+        self.gate = DetectionGate() if global_parameters['DETECTION_GATE'] else None
+        self.governor = FrameGovernor() if global_parameters['FRAME_GOVERNOR'] else None
+
+        # Capture time of the last frame searched, and the boxes found on it that may still be admitted
+        self.tracked_time = 0
+        self.pending = []
+        self.scan_count = 0
+        # Planning model runs headless, a path can be replayed from model.trajectory with a RobotViewer
         self.model = Robot(global_parameters['ROBOT_BASE_POINT'], global_parameters['VIDEO_SCALE'])
     def __repr__(self):
         return "FrameHandler Object\n\tModel:" + self.model.__repr__()
 
     def process_frame(self, frame, read_time, draw=False):
-        start = time.time()
-        self.frame = bounding_box.scale(frame)
-        self.frame = cv2.copyMakeBorder(self.frame, 0, 300, 300, 300, cv2.BORDER_CONSTANT, value=0)
+        ''' read_time is when frame was captured, not when it is processed '''
+        if self.governor is not None:
+            self.governor.start_frame()
+
+        ret = self.handle_frame(frame, read_time, draw)
+
+        if self.governor is not None:
+            self.governor.mark("plan")
+            self.governor.end_frame()
+        return ret
+
+    def setting(self, key):
+        ''' Returns a vision parameter, lowered by the governor if frames are overrunning '''
+        if self.governor is None:
+            return global_parameters[key]
+        return self.governor.get(key)
+
+    def mark(self, stage):
+        if self.governor is not None:
+            self.governor.mark(stage)
+
+    def handle_frame(self, frame, read_time, draw):
+        self.frame = bounding_box.scale(frame, method=self.setting('SCALE_METHOD'))
 
         if draw:
-            cv2.imshow("Temp", self.frame)
+            cv2.imshow("Temp", bounding_box.pad_to_canvas(self.frame))
+
+        # Detections are offset onto the robot canvas rather than padding the frame itself
+        canvas_shape = bounding_box.get_canvas_shape(self.frame)
+        offset = bounding_box.get_canvas_offset()
+
+        iH, _, _ = canvas_shape
+
+        if self.admitted_time is not None:
+            self.admitted.step((read_time - self.admitted_time) * global_parameters['FRAME_RATE'])
+        self.admitted_time = read_time
+        self.admitted.expire(limit=iH / 2 + bounding_box.get_roi_margin(canvas_shape))
+
+        self.mark("scale")
+        if self.gate is not None:
+            self.gate.stride = self.setting('GATE_STRIDE')
+
+        pending, self.pending = self.pending, []
+        if global_parameters['ROI_DETECTION']:
+            # Only the acceptance band, padded by the morphology reach so its mask is exact, is searched
+            margin = bounding_box.get_roi_margin(canvas_shape)
+            roi = (iH / 6 - margin - offset[1], iH / 2 + margin - offset[1])
+            if self.gate is not None and not self.gate.check(self.frame[max(int(roi[0]), 0):max(int(round(roi[1])), 0)]):
+                self.tracked_time = read_time
+                self.mark("detect")
+                return True
+            if self.setting('PREDICTED_WINDOWS'):
+                data = self.search_windows(read_time, canvas_shape, offset, margin, pending)
+            else:
+                data = self.search_band(canvas_shape, offset, margin)
+        else:
+            if self.gate is not None and not self.gate.check(self.frame):
+                self.mark("detect")
+                return True
+            data, _, _ = bounding_box.get_bbox(self.frame, frame_shape=canvas_shape, offset=offset, oriented=self.setting('ORIENTED_BOXES'))
 
-        iH, _, _ = self.frame.shape
-        data, _, _ = bounding_box.get_bbox(self.frame)
+        self.mark("detect")
 
         if (data != 0):
+            found = []
             for i in range(0, len(data)):
                 cX = int(data[i][1]["m10"] / data[i][1]["m00"])
                 cY = int(data[i][1]["m01"] / data[i][1]["m00"])
 
-                if iH / 6 < cY and iH / 2 > cY:
-                    if len(self.meats) == 0: # Marks the time of the first of two meats 
-                        self.start = start
-                    if self.flip_flop:
-                        self.meats += [meat.Meat(data[i], side="Right", center=[cX, cY])]
-                    else:
-                        self.meats += [meat.Meat(data[i], side="Left", center=[cX, cY])]
+                if iH / 6 < cY and iH / 2 > cY and not self.is_admitted(cX, cY):
+                    found += [[cY, cX, i]]
+                elif cY >= iH / 2 and data[i][0][:,1].min() < iH / 2 and not self.is_admitted(cX, cY):
+                    # Touching pieces can still split into one that is admitted
+                    self.pending += [data[i][0]]
+
+            if len(found) > 0:
+                # Pieces furthest down the belt are admitted first so sides alternate in belt order
+                found.sort(key=lambda f: (-f[0], f[1]))
+                sides = []
+                for _ in found:
+                    sides += ["Right" if self.flip_flop else "Left"]
                     self.flip_flop = not self.flip_flop
 
-                    if len(self.meats) > 1:
-                        self.find_path(read_time)
-                        if not self.model.gen_profiles(): # If path creation failed (collision, etc)
-                            # self.xs = []
-                            return False
+                meats = meat.Meat.from_batch([data[i][0] for _, _, i in found], sides, [[cX, cY] for cY, cX, _ in found])
+                for m in meats:
+                    self.admitted.add(m)
+                self.meats += meats
+                self.meat_times += [read_time] * len(meats)
 
-                    break # Ensures only one piece is identified 
+            # Every complete pair gets a path, a pair that cannot be moved yet waits for the next frame
+            while len(self.meats) > 1:
+                planned = self.find_path()
+                if planned is None:
+                    break
+                if not planned or not self.model.gen_profiles(): # If path creation failed (collision, etc)
+                    # self.xs = []
+                    return False
+                xs, _, vels = self.model.get_data()
+                self.results += [(xs, vels)]
         
         return True
 
-    def find_path(self, read_time):
-        self.dt = time.time() - self.start
+    def is_admitted(self, cX, cY):
+        ''' True if (cX, cY) lies within half a width of where an admitted piece should be by now '''
+        if len(self.admitted) == 0:
+            return False
+        dists = np.linalg.norm(self.admitted.position_at() - [cX, cY], axis=1)
+        return bool(np.any(dists < self.admitted.widths[:len(self.admitted)] / 2))
+
+    def overlaps_admitted(self, box):
+        ''' True if box overlaps where an admitted piece should be by now '''
+        if len(self.admitted) == 0:
+            return False
+        boxes = self.admitted.boxes_at()
+        return bool(np.any((boxes[:,:,0].min(axis=1) < box[:,0].max()) & (boxes[:,:,0].max(axis=1) > box[:,0].min()) & \
+            (boxes[:,:,1].min(axis=1) < box[:,1].max()) & (boxes[:,:,1].max(axis=1) > box[:,1].min())))
+
+    def search_windows(self, read_time, canvas_shape, offset, margin, pending):
+        '''
+        Searches only where a piece can first lie wholly in the band, which
+        is the entry strip at the top of the band. It holds a piece up to 
+        PIECE_LENGTH long that the belt has carried past the band edge since
+        the last frame. Admitted pieces further down are not searched again.
+        The whole band is searched while a piece found on the last frame may
+        still be admitted (e.g. one touching another), and every 
+        FULL_SCAN_INTERVAL frames. Returns detections like search. 
+        '''
+        iH = canvas_shape[0]
+        # Columns of the camera frame on the canvas, the rest is padding 
+        cols = (offset[0], offset[0] + self.frame.shape[1])
+        travel = (read_time - self.tracked_time) * global_parameters['FRAME_RATE'] * global_parameters['CONVEYOR_SPEED']
+        slack = global_parameters['WINDOW_MARGIN'] * global_parameters['VIDEO_SCALE']
+        length = global_parameters['PIECE_LENGTH'] * global_parameters['VIDEO_SCALE']
+
+        band = (iH / 6 - margin, iH / 2 + margin)
+        window = [band[0], min(iH / 6 + travel + length + margin + slack, band[1]), cols[0], cols[1]]
+        if len(pending) > 0 or self.scan_count % self.setting('FULL_SCAN_INTERVAL') == 0:
+            window[1] = band[1]
+
+        self.scan_count += 1
+        self.tracked_time = read_time
+
+        return self.search([window], canvas_shape, offset)
+
+    def search_band(self, canvas_shape, offset, margin):
+        ''' Searches the whole acceptance band, returns detections like search '''
+        iH = canvas_shape[0]
+        window = [iH / 6 - margin, iH / 2 + margin, offset[0], offset[0] + self.frame.shape[1]]
+        return self.search([window], canvas_shape, offset)
+
+    def search(self, windows, canvas_shape, offset):
+        '''
+        Returns the detections of pieces in the canvas windows, like get_bbox.
+        A piece still crossing the top edge of the acceptance band is left for
+        a later frame, it is admitted once the belt has carried all of it into
+        the band. A piece a window clips (e.g. one reaching past the bottom of
+        the band) that has not been admitted is searched for again in that
+        window grown a piece length past the cut, so every piece returned is
+        exactly as get_bbox finds it in the whole frame. 
+        '''
+        reach_y, reach_x = bounding_box.get_kernel_reach(canvas_shape)
+        length = global_parameters['PIECE_LENGTH'] * global_parameters['VIDEO_SCALE']
+        rows = (offset[1], offset[1] + self.frame.shape[0])
+        cols = (offset[0], offset[0] + self.frame.shape[1])
+
+        ret, cut = self.search_pass(windows, canvas_shape, offset)
+        while len(cut) > 0:
+            # Each edge that clipped a piece moves out by a piece length, up to the camera frame
+            grown = []
+            for (y0, y1, x0, x1), box in cut:
+                ys, xs = box[:,1], box[:,0]
+                grown += [[max(y0 - (length if ys.min() <= y0 + reach_y + 2 else 0), rows[0]), \
+                    min(y1 + (length if ys.max() >= y1 - reach_y - 2 else 0), rows[1]), \
+                    max(x0 - (length if xs.min() <= x0 + reach_x + 2 else 0), cols[0]), \
+                    min(x1 + (length if xs.max() >= x1 - reach_x - 2 else 0), cols[1])]]
+            found, cut = self.search_pass(bounding_box.merge_windows(grown), canvas_shape, offset)
+            # A grown window covers the one it grew from, so pieces may be found twice
+            for d in found:
+                if not any(abs(d[1]["m10"] / d[1]["m00"] - r[1]["m10"] / r[1]["m00"]) < 2 and \
+                    abs(d[1]["m01"] / d[1]["m00"] - r[1]["m01"] / r[1]["m00"]) < 2 for r in ret):
+                    ret += [d]
+
+        if len(ret) == 0:
+            return 0
+        return ret
+
+    def search_pass(self, windows, canvas_shape, offset):
+        '''
+        Returns the detections search keeps from one pass over the windows, 
+        and the (window, box) of every piece not yet admitted that comes 
+        within the morphology reach of a window edge inside the camera frame
+        (its mask may be clipped there). The rest of that window's 
+        detections are dropped, it is searched again once grown. 
+        '''
+        iH = canvas_shape[0]
+        reach_y, reach_x = bounding_box.get_kernel_reach(canvas_shape)
+        rows = (offset[1], offset[1] + self.frame.shape[0])
+        cols = (offset[0], offset[0] + self.frame.shape[1])
+        # Band edges the camera can see past
+        top = iH / 6 if iH / 6 > rows[0] else -np.inf
+        bottom = iH / 2 if iH / 2 < rows[1] else np.inf
+        ret = []
+        cut = []
+        for window in windows:
+            y0, y1, x0, x1 = window
+            roi = (y0 - offset[1], y1 - offset[1], x0 - offset[0], x1 - offset[0])
+            data, _, _ = bounding_box.get_bbox(self.frame, roi=roi, frame_shape=canvas_shape, offset=offset, oriented=self.setting('ORIENTED_BOXES'))
+            if data == 0:
+                continue
+
+            # Only the mask further than the reach from an edge inside the camera frame is exact
+            exact = (y0 + reach_y if y0 > rows[0] else -np.inf, y1 - reach_y if y1 < rows[1] else np.inf, \
+                x0 + reach_x if x0 > cols[0] else -np.inf, x1 - reach_x if x1 < cols[1] else np.inf)
+            found = []
+            for d in data:
+                ys, xs = d[0][:,1], d[0][:,0]
+                if ys.min() <= top + 2 and ys.max() < min(bottom, exact[1]) - 2: # Still coming into the band
+                    continue
+                if ys.min() <= exact[0] + 2 or ys.max() >= exact[1] - 2 or xs.min() <= exact[2] + 2 or xs.max() >= exact[3] - 2:
+                    self.pending += [d[0]]
+                    if not self.overlaps_admitted(d[0]):
+                        cut += [(window, d[0])]
+                        break
+                    continue
+                found += [d]
+            else:
+                ret += found
+        return ret, cut
+
+    def find_path(self):
+        '''
+        Plans the path of the first pair in self.meats, timed from the frame
+        its first piece was found on. Returns None if it cannot be moved yet,
+        otherwise whether the path was planned without a collision. 
+        '''
+        # Time between the two images, independent of how long they waited to be processed
+        self.start = self.meat_times[0]
+        self.dt = self.meat_times[1] - self.start
         # Profiler model creates motion profiles, it updates as fast as possible in a separate thread
         if self.model.phase == 0:
             dist = (global_parameters['PICKUP_POINT'] - self.meats[0].get_center_as_point()).y
@@ -71,13 +289,20 @@ class FrameHandler:
                 self.model.move_meat(self.start_point_1, self.start_point_2, self.end_pt1, \
                     self.end_pt2, dist / global_parameters['CONVEYOR_SPEED'], self.meats[0].width, \
                         self.meats[1].width, phase_1_delay=False)
-                self.meats = []
-                # Given the start and end conditions, calculate the model motor profiles
-                self.model.run(read_time, dist) 
+                self.meats = self.meats[2:]
+                self.meat_times = self.meat_times[2:]
+                # Given the start and end conditions, calculate the model motor profiles. Stepped
+                # through update only when a viewer is shown each step, plan gives the same path.
+                if self.model.viewer is None:
+                    return self.model.plan(self.start, dist)
+                # A collision while stepping scraps the data, which gen_profiles then rejects
+                self.model.run(self.start, dist)
+                return True
+        return None
 
     def get_results(self):
-        if len(self.meats) == 0:
-            xs, _, vels = self.model.get_data()
-            return xs, vels
+        ''' Returns the profiles of the oldest path not yet taken, once. Call until it returns none. '''
+        if len(self.results) > 0:
+            return self.results.pop(0)
         else:
             return [], []
\ No newline at end of file
@@ -1,6 +1,6 @@
 import numpy as np
 
-from ..model.point import Point
+from ..model.point import Point, PointArray
 from ..global_parameters import global_parameters
 
 class PathFinder:
@@ -56,6 +56,8 @@ class PathFinder:
 
         ret += [end_point]
 
+        ret = PointArray.from_points(ret)
+
         # Runs through all path points and sets an angle increment 
         diff = end_point.angle - start_point.angle
 
@@ -67,7 +69,7 @@ class PathFinder:
             else:
                 dA = diff/(len(ret)-1)
 
-            for i in range(1, len(ret)-1):
-                ret[i].angle = start_point.angle + dA*i
+            angles = ret.get_angles()
+            angles[1:-1] = start_point.angle + dA*np.arange(1, len(ret)-1)
 
-        return ret
\ No newline at end of file
+        return ret
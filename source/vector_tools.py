@@ -2,7 +2,8 @@ import numpy as np
 
 def get_normal_unit(p1, p2):
     k = np.subtract(p1, p2)
-    x = np.array([(k / np.linalg.norm(k))[1], -1*(k / np.linalg.norm(k))[0]])  # Find perpendicular normal
+    k = k / np.linalg.norm(k)
+    x = np.array([k[1], -1*k[0]])  # Find perpendicular normal
     return x
 
 def distance(self, pt1, pt2):
@@ -1,8 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import cv2
 from skimage import feature 
 
 from ..global_parameters import global_parameters
+from ..global_parameters import add_parameter_listener
+from . import calibration
 
 def crop(img):
     '''Crops image to be largest square possible'''
@@ -11,7 +15,48 @@ def crop(img):
     ret = img[(iH - crop_size)//2:(iH - crop_size)//2 + crop_size,(iW - crop_size)//2:(iW - crop_size)//2+crop_size]
     return ret
 
-def scale(img, width=250):
+# Interpolation used by scale for each method once any decimation is done 
+SCALE_INTERPOLATION = {
+    "cubic" : cv2.INTER_CUBIC,
+    "linear" : cv2.INTER_LINEAR,
+    "nearest" : cv2.INTER_NEAREST,
+    "area" : cv2.INTER_AREA,
+    "pyramid" : cv2.INTER_AREA,
+    "stride" : cv2.INTER_NEAREST
+}
+
+def get_scale_method(factor):
+    '''
+    Picks a scale method for a given downscaling factor (source width / 
+    destination width). Upscaling keeps cubic interpolation. Downscaled 
+    frames are only masked and refined, so they use linear interpolation,
+    see tools/scale_benchmark.py for the drift and cost of each method. 
+    '''
+    if factor <= 1:
+        return "cubic"
+    else:
+        return "linear"
+
+def scale(img, width=250, method=None):
+    '''
+    Resizes img to the given width, keeping its aspect ratio. 
+
+    method is one of the SCALE_INTERPOLATION keys or "auto", and defaults 
+    to SCALE_METHOD. "pyramid" halves the frame with pyrDown until it is 
+    less than twice the width and "stride" decimates it by the largest 
+    whole factor before the final resize. 
+
+    If CALIBRATION_FILE is set the frame is instead undistorted, rectified
+    to the belt and scaled in a single remap, see calibration.py. 
+
+    Frames already at the width, e.g. from a scaled frame cache, are 
+    returned as they are. 
+    '''
+    if img.shape[1] == width:
+        return np.ascontiguousarray(img)
+    if global_parameters['CALIBRATION_FILE'] is not None:
+        return calibration.rectify(img, width)
+
     iH, iW, _ = img.shape
 
     final_window_width = width
@@ -19,80 +64,361 @@ def scale(img, width=250):
     dest_width = final_window_width
     dest_height = round((final_window_width / iW) * iH)
 
-    res = cv2.resize(img, dsize=(dest_width, dest_height), interpolation=cv2.INTER_CUBIC)
+    if method is None:
+        method = global_parameters['SCALE_METHOD']
+    if method == "auto":
+        method = get_scale_method(iW / dest_width)
+
+    if method == "pyramid":
+        while img.shape[1] >= 2 * dest_width:
+            img = cv2.pyrDown(img)
+    elif method == "stride":
+        step = iW // dest_width
+        if step > 1:
+            img = img[::step, ::step]
+
+    if img.shape[0] == dest_height and img.shape[1] == dest_width:
+        return np.ascontiguousarray(img)
+
+    res = cv2.resize(img, dsize=(dest_width, dest_height), interpolation=SCALE_INTERPOLATION[method])
     return res
 
-def get_bbox(img, lower_mask=global_parameters['LOWER_MASK'], upper_mask=global_parameters['UPPER_MASK'], source="Image"):
+def get_bbox(img, lower_mask=None, upper_mask=None, source="Image", roi=None, frame_shape=None, offset=(0, 0), oriented=None):
     '''
     Returns bounding polygons for the all identified middles 
-    in the image
+    in the image. 
+
+    img may be an unpadded camera frame sitting at offset (x, y) inside a
+    padded frame of frame_shape (see get_canvas_offset and get_canvas_shape). 
+    Polygons and contours are then returned in padded frame coordinates. 
+
+    If roi=(y0, y1) is given only those rows of img are masked and searched,
+    roi=(y0, y1, x0, x1) limits the columns as well. The returned mask only 
+    covers the window. Masks default to the configured LOWER_MASK and 
+    UPPER_MASK, oriented is passed on to thresh_callback. 
     '''
-    temp = gen_mask(img, lower_mask=lower_mask, upper_mask=upper_mask)
-    bound_poly, contours = thresh_callback(temp)
+    iH, iW, _ = img.shape
+    if frame_shape is None:
+        frame_shape = img.shape
+
+    # Zero padding around img in the padded frame 
+    top, left = offset[1], offset[0]
+    bottom = frame_shape[0] - iH - top
+    right = frame_shape[1] - iW - left
+
+    if roi is None:
+        temp = gen_mask(img, lower_mask=lower_mask, upper_mask=upper_mask, frame_shape=frame_shape, border=(top, bottom, left, right))
+        bound_poly, contours = thresh_callback(temp, offset=offset, oriented=oriented)
+    else:
+        y0 = min(max(int(roi[0]), 0), iH)
+        y1 = min(max(int(round(roi[1])), y0), iH)
+        x0, x1 = 0, iW
+        if len(roi) == 4:
+            x0 = min(max(int(roi[2]), 0), iW)
+            x1 = min(max(int(round(roi[3])), x0), iW)
+
+        # Kernels are sized from the full frame so the window is refined exactly as it would be in place
+        border = (top if y0 == 0 else 0, bottom if y1 == iH else 0, left if x0 == 0 else 0, right if x1 == iW else 0)
+        temp = gen_mask(img[y0:y1, x0:x1], lower_mask=lower_mask, upper_mask=upper_mask, frame_shape=frame_shape, border=border)
+        bound_poly, contours = thresh_callback(temp, offset=(offset[0] + x0, offset[1] + y0), oriented=oriented)
 
     return bound_poly, contours, temp
 
-def gen_mask(img, lower_mask=global_parameters['LOWER_MASK'], upper_mask=global_parameters['UPPER_MASK'], bitwise_and=False, process=True):
+def merge_windows(windows):
+    ''' Merges overlapping (y0, y1, x0, x1) windows into their bounding windows '''
+    windows = [list(w) for w in windows]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(0, len(windows)):
+            for j in range(i + 1, len(windows)):
+                a, b = windows[i], windows[j]
+                if a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]:
+                    windows[i] = [min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])]
+                    del windows[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return windows
+
+def get_canvas_offset():
+    ''' Returns the (x, y) offset from scaled camera pixels to robot canvas pixels '''
+    top, _, left, _ = global_parameters['CANVAS_PADDING']
+    return (left, top)
+
+def get_canvas_shape(img):
+    ''' Returns the shape img would have if it were padded onto the robot canvas '''
+    top, bottom, left, right = global_parameters['CANVAS_PADDING']
+    iH, iW = img.shape[0:2]
+    return (iH + top + bottom, iW + left + right) + img.shape[2:]
+
+def to_canvas(pts):
+    ''' Translates points from scaled camera pixels to robot canvas pixels '''
+    return np.add(pts, get_canvas_offset())
+
+def pad_to_canvas(img):
+    ''' 
+    Pads a scaled camera frame onto the robot canvas. Detection does
+    not need this, it is only required for drawing. 
     '''
-    Masks input img based off HSV colour ranges provided 
+    top, bottom, left, right = global_parameters['CANVAS_PADDING']
+    return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=0)
+
+# Structuring elements for gen_mask keyed by the (rows, cols) of the frame they are sized from 
+kernel_cache = {}
+
+def get_kernel_sizes(frame_shape):
+    ''' Returns the [rows, cols] of the three morphology kernels used by gen_mask '''
+    iH, iW = frame_shape[0:2]
+    return [[round(iW*0.013),round(iH*0.013)], [round(iW*0.02),round(iH*0.02)], [round(iW*0.035),round(iH*0.035)]]
+
+def get_kernels(frame_shape):
     '''
-    iH, iW, _ = img.shape
+    Returns the three rectangular structuring elements used by gen_mask.
+    They are only built the first time a frame shape is seen. 
+    '''
+    key = tuple(frame_shape[0:2])
+    if key not in kernel_cache:
+        kernel_cache[key] = [cv2.getStructuringElement(cv2.MORPH_RECT, (cols, rows)) for rows, cols in get_kernel_sizes(frame_shape)]
+    return kernel_cache[key]
 
-    #Masks colour ranges provided
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+def get_kernel_reach(frame_shape):
+    '''
+    Returns the (rows, cols) the morphology in gen_mask can reach past
+    a pixel. Anything further away cannot change its refined value. 
+    '''
+    k1, k2, k3 = get_kernel_sizes(frame_shape)
+    # dilate(k1), erode(k2), dilate(k3), erode(k3)
+    return (k1[0]//2 + k2[0]//2 + 2*(k3[0]//2), k1[1]//2 + k2[1]//2 + 2*(k3[1]//2))
 
-    mask = cv2.inRange(hsv, lower_mask, upper_mask)
+def get_roi_margin(frame_shape):
+    '''
+    Returns the number of rows a band has to be padded by so that its 
+    refined mask is identical to the same rows of the full frame mask. 
+    '''
+    return get_kernel_reach(frame_shape)[0]
 
-    cv2.bitwise_not(mask)
+def gen_mask(img, lower_mask=None, upper_mask=None, bitwise_and=False, process=True, frame_shape=None, border=(0, 0, 0, 0), threads=None):
+    '''
+    Masks input img based off HSV colour ranges provided. Masks default to 
+    the configured LOWER_MASK and UPPER_MASK, which use the colour lookup 
+    table when COLOUR_LUT is set. 
 
-    if process:
-        # Expands border to ensure when dilating shape is maintained 
-        mask = cv2.copyMakeBorder(mask, 0, 0, 15, 15, cv2.BORDER_CONSTANT, value=0)
+    frame_shape sets the shape the morphology kernels are sized from, 
+    e.g. the robot canvas shape or the full frame when img is a band. 
+    border is the (top, bottom, left, right) zero padding around img in 
+    that frame, only as much of it as the morphology can reach is built. 
+
+    With more than one thread (defaults to STRIPE_THREADS) a processed
+    mask is built in row stripes in parallel, see gen_mask_striped. 
+    '''
+    if frame_shape is None:
+        frame_shape = img.shape
+    if threads is None:
+        threads = global_parameters['STRIPE_THREADS']
 
-        kernel = np.ones([round(iW*0.013),round(iH*0.013)])
-        refined = cv2.dilate(mask, kernel)
+    if process and threads > 1:
+        refined = gen_mask_striped(img, lower_mask, upper_mask, frame_shape, border, threads)
+        if bitwise_and:
+            return cv2.bitwise_and(img, img, mask=refined)
+        return refined
 
-        kernel = np.ones([round(iW*0.02),round(iH*0.02)])
-        refined = cv2.erode(refined, kernel)
+    if lower_mask is None and upper_mask is None and global_parameters['COLOUR_LUT']:
+        mask = apply_colour_lut(img, get_colour_lut())
+    else:
+        if lower_mask is None:
+            lower_mask = global_parameters['LOWER_MASK']
+        if upper_mask is None:
+            upper_mask = global_parameters['UPPER_MASK']
 
-        kernel = np.ones([round(iW*0.035),round(iH*0.035)])
-        refined = cv2.dilate(refined, kernel)
-        refined = cv2.erode(refined, kernel)
+        #Masks colour ranges provided
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
 
-        # kernel = np.ones([round(iW*0.08),round(iH*0.08)])
-        # refined = cv2.morphologyEx(refined, cv2.MORPH_CLOSE, kernel)
+        mask = cv2.inRange(hsv, lower_mask, upper_mask)
 
-        # kernel = np.ones([round(iW*0.1),round(iH*0.1)])
-        # refined = cv2.morphologyEx(refined, cv2.MORPH_CLOSE, kernel)
+    if process:
+        refined = refine_mask(mask, frame_shape, border=border)
     else:
         refined = mask
 
     if bitwise_and:
         return cv2.bitwise_and(img, img, mask=refined)
-    return refined[:,16:-16]
+    return refined
+
+# Thread pool for gen_mask_striped, rebuilt when the thread count changes 
+stripe_pool = None
+stripe_threads = 0 # Workers in stripe_pool
+
+def get_stripe_pool(threads):
+    global stripe_pool, stripe_threads
+    if stripe_pool is None or stripe_threads != threads:
+        if stripe_pool is not None:
+            stripe_pool.shutdown()
+        stripe_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="stripe")
+        stripe_threads = threads
+    return stripe_pool
+
+def get_stripes(rows, reach, count):
+    ''' Returns (y0, y1) for up to count stripes covering rows, none shorter than reach '''
+    count = max(1, min(count, rows // max(reach, 1)))
+    edges = np.linspace(0, rows, count + 1).round().astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+def gen_mask_striped(img, lower_mask, upper_mask, frame_shape, border, threads):
+    '''
+    Builds the processed mask of img in horizontal stripes on a thread 
+    pool. cvtColor, inRange and the morphology release the GIL, so the 
+    stripes are masked in parallel. 
+
+    Each stripe is masked with get_kernel_reach rows of its neighbours 
+    on either side, which are then dropped, so the stitched mask is 
+    identical to the one built in a single pass. Contours are traced on
+    the stitched mask, which joins pieces crossing stripe boundaries. 
+    '''
+    iH = img.shape[0]
+    reach = get_kernel_reach(frame_shape)[0]
+    ret = np.empty(img.shape[0:2], dtype=np.uint8)
+
+    def mask_stripe(stripe):
+        y0, y1 = stripe
+        s0, s1 = max(y0 - reach, 0), min(y1 + reach, iH)
+        stripe_border = (border[0] if s0 == 0 else 0, border[1] if s1 == iH else 0, border[2], border[3])
+        refined = gen_mask(img[s0:s1], lower_mask=lower_mask, upper_mask=upper_mask, frame_shape=frame_shape, \
+            border=stripe_border, threads=1)
+        ret[y0:y1] = refined[y0 - s0:y1 - s0]
 
-def thresh_callback(mask):
-    ''' Returns single convex hull of all contours of mask '''   
+    # list() waits for every stripe and raises anything a stripe raised 
+    list(get_stripe_pool(threads).map(mask_stripe, get_stripes(iH, reach, threads)))
+    return ret
+
+# Bit-packed BGR to mask table for the configured colour range 
+colour_lut = None
+
+def build_colour_lut(lower_mask, upper_mask):
+    '''
+    Returns a bit-packed table of the HSV mask value of every BGR colour,
+    indexed by (b << 16) | (g << 8) | r. Every colour goes through 
+    cvtColor and inRange once so the table matches them exactly. 
+    '''
+    bgr = np.empty([256, 65536, 3], dtype=np.uint8)
+    bgr[:,:,0] = np.arange(256, dtype=np.uint8)[:,None]
+    bgr[:,:,1] = (np.arange(65536) >> 8).astype(np.uint8)
+    bgr[:,:,2] = (np.arange(65536) & 255).astype(np.uint8)
 
-    contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    mask = cv2.inRange(cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV), lower_mask, upper_mask)
+    return np.packbits(mask.ravel() > 0, bitorder='little')
+
+def get_colour_lut():
+    ''' Returns the table for the configured colour range, building it if needed '''
+    global colour_lut
+    if colour_lut is None:
+        colour_lut = build_colour_lut(global_parameters['LOWER_MASK'], global_parameters['UPPER_MASK'])
+    return colour_lut
+
+def rebuild_colour_lut():
+    ''' Rebuilds the table once a new configuration is loaded '''
+    global colour_lut
+    colour_lut = None
+    if global_parameters['COLOUR_LUT']:
+        get_colour_lut()
+
+add_parameter_listener(rebuild_colour_lut)
+
+def apply_colour_lut(img, lut):
+    ''' Masks a BGR image with a table from build_colour_lut in one gather '''
+    temp = img.astype(np.uint32)
+    index = (temp[:,:,0] << 16) | (temp[:,:,1] << 8) | temp[:,:,2]
+    return ((lut[index >> 3] >> (index & 7).astype(np.uint8)) & 1) * np.uint8(255)
+
+def refine_mask(mask, frame_shape, border=(0, 0, 0, 0)):
+    '''
+    Fills holes and removes specks from a colour mask. Equivalent to 
+    dilate(k1), erode(k2), dilate(k3), erode(k3) with the kernels of 
+    get_kernels, the last pair being a single closing. 
+    '''
+    # Expands border to ensure when dilating shape is maintained 
+    reach_y, reach_x = get_kernel_reach(frame_shape)
+    top, bottom, left, right = min(border[0], reach_y), min(border[1], reach_y), min(border[2], reach_x), min(border[3], reach_x)
+    if top or bottom or left or right:
+        mask = cv2.copyMakeBorder(mask, top, bottom, left, right, cv2.BORDER_CONSTANT, value=0)
+
+    k1, k2, k3 = get_kernels(frame_shape)
+
+    refined = cv2.dilate(mask, k1)
+    refined = cv2.erode(refined, k2)
+    refined = cv2.morphologyEx(refined, cv2.MORPH_CLOSE, k3)
+
+    # kernel = np.ones([round(iW*0.08),round(iH*0.08)])
+    # refined = cv2.morphologyEx(refined, cv2.MORPH_CLOSE, kernel)
+
+    # kernel = np.ones([round(iW*0.1),round(iH*0.1)])
+    # refined = cv2.morphologyEx(refined, cv2.MORPH_CLOSE, kernel)
+
+    return refined[top:refined.shape[0] - bottom, left:refined.shape[1] - right]
+
+def get_area_bound(w, h):
+    '''
+    Returns an upper bound on the area of the integer box thresh_callback
+    builds for a contour with a w x h bounding rect. minAreaRect is never 
+    larger than the bounding rect, and truncating its corners to pixels 
+    moves each by less than sqrt(2), which can add at most a sqrt(2) wide 
+    strip around a rect whose sides are each shorter than the diagonal. 
+    '''
+    return w*h + 4*np.sqrt(2)*np.hypot(w, h) + 2*np.pi
+
+def thresh_callback(mask, offset=(0, 0), oriented=None):
+    '''
+    Returns the rotated bounding box and its moments for every outer 
+    contour of mask with an area of at least MINIMUM_AREA, along with all
+    the contours found. Contours are shifted by offset (x, y). 
+
+    Contours whose bounding rect is too small to ever reach MINIMUM_AREA 
+    are dropped before any rotated rect or moments are computed. If 
+    oriented is False (defaults to ORIENTED_BOXES) connected components 
+    are used instead and the boxes are axis aligned, the returned contours
+    are then the boxes of every component. 
+    '''
+    if oriented is None:
+        oriented = global_parameters['ORIENTED_BOXES']
+    if not oriented:
+        return component_boxes(mask, offset=offset)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
 
     if (len(contours) == 0):
         return 0, 0
 
-    minRects = [None]*len(contours)
-    for i, c in enumerate(contours):
+    ret = []
+    for c in contours:
+        _, _, w, h = cv2.boundingRect(c)
+        if get_area_bound(w, h) < global_parameters['MINIMUM_AREA']:
+            continue
+
         temp = np.intp(cv2.boxPoints(cv2.minAreaRect(c)))
-        minRects[i] = [temp, cv2.moments(temp)]
+        m = cv2.moments(temp)
+        if (m['m00'] >= global_parameters['MINIMUM_AREA']):
+            ret += [[temp, m]]
+
+    return ret, contours
 
-    filt = []
-    for i in range(0, len(minRects)):
-        flag = True
-        if (minRects[i][1]['m00'] < global_parameters['MINIMUM_AREA']):
-            flag = False
-            
-        filt += [flag]
+def component_boxes(mask, offset=(0, 0)):
+    ''' Axis aligned version of thresh_callback using connectedComponentsWithStats '''
+    n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    if n < 2: # Label 0 is the background
+        return 0, 0
 
-    ret = [minRects[i] for i in range(0, len(minRects)) if filt[i]==True]
+    x = stats[1:, cv2.CC_STAT_LEFT] + offset[0]
+    y = stats[1:, cv2.CC_STAT_TOP] + offset[1]
+    w = stats[1:, cv2.CC_STAT_WIDTH] - 1
+    h = stats[1:, cv2.CC_STAT_HEIGHT] - 1
+    # Same corner order as boxPoints 
+    boxes = np.stack([np.stack([x, y + h], axis=1), np.stack([x, y], axis=1), \
+        np.stack([x + w, y], axis=1), np.stack([x + w, y + h], axis=1)], axis=1).astype(np.intp)
 
+    ret = []
+    for i in np.flatnonzero(w * h >= global_parameters['MINIMUM_AREA']):
+        ret += [[boxes[i], cv2.moments(boxes[i])]]
 
-    return ret, contours
\ No newline at end of file
+    return ret, list(boxes)
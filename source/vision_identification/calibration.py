@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import cv2
+
+from ..global_parameters import global_parameters
+from ..global_parameters import add_parameter_listener
+
+'''
+    Maps raw camera frames straight onto the belt plane. A calibration file
+    (.npz) holds:
+
+        camera_matrix, dist_coeffs  Lens intrinsics from cv2.calibrateCamera
+        image_points                4 x 2 pixel positions of marks on the belt
+        belt_points                 4 x 2 positions of those marks in m,
+                                    measured from the top left of the view
+        view_size                   (width, height) of the belt view in m
+        image_size                  (width, height) of the raw frames in px
+
+    Undistortion, perspective rectification to the belt, cropping to the
+    view and downscaling are folded into a single cv2.remap map, so a frame
+    only makes one pass through memory. Maps are cached in memory and saved
+    next to the calibration file for every output width. Frames have to be
+    the size the camera was calibrated at, and the output VIDEO_SCALE px/m.
+'''
+
+# (map1, map2, image size) keyed by (calibration path, output width)
+remap_cache = {}
+
+def save_calibration(path, camera_matrix, dist_coeffs, image_points, belt_points, view_size, image_size):
+    np.savez(path, camera_matrix=camera_matrix, dist_coeffs=dist_coeffs, image_points=image_points, \
+        belt_points=belt_points, view_size=view_size, image_size=image_size)
+
+def load_calibration(path):
+    with np.load(path) as data:
+        return {key : data[key] for key in data.files}
+
+def get_output_size(calibration, width):
+    ''' Returns the (width, height) of the rectified view scaled to width px '''
+    view_w, view_h = calibration['view_size']
+    return (width, int(round(view_h * width / view_w)))
+
+def build_remap(calibration, width):
+    '''
+    Returns the fixed point maps taking a raw frame to the rectified view,
+    width px wide. Each output pixel is taken back through the belt
+    homography to an undistorted pixel and then through the lens model to
+    the raw frame, which is what initUndistortRectifyMap does when the
+    homography is passed as its rectification transform. The view has to 
+    come out at VIDEO_SCALE px/m, which every distance in m relies on. 
+    '''
+    expected = int(round(calibration['view_size'][0] * global_parameters['VIDEO_SCALE']))
+    if width != expected:
+        raise ValueError("Calibrated view is " + str(calibration['view_size'][0]) + " m wide, which is " + \
+            str(expected) + " px at VIDEO_SCALE, not " + str(width) + " px")
+
+    camera_matrix = calibration['camera_matrix'].astype(np.float64)
+    dist_coeffs = calibration['dist_coeffs'].astype(np.float64)
+    size = get_output_size(calibration, width)
+    px_per_m = width / calibration['view_size'][0]
+
+    # Belt marks in undistorted pixels -> output pixels
+    undistorted = cv2.undistortPoints(calibration['image_points'].reshape((-1, 1, 2)).astype(np.float64), \
+        camera_matrix, dist_coeffs, P=camera_matrix).reshape((-1, 2))
+    homography = cv2.getPerspectiveTransform(undistorted.astype(np.float32), \
+        (calibration['belt_points'] * px_per_m).astype(np.float32))
+
+    map1, map2 = cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, homography @ camera_matrix, \
+        np.eye(3), size, cv2.CV_16SC2)
+    return map1, map2
+
+def get_remap(path, width):
+    '''
+    Returns the maps for a calibration file and the (width, height) of the
+    frames it was made for, loading or building and saving them if needed. 
+    '''
+    key = (path, width)
+    if key in remap_cache:
+        return remap_cache[key]
+
+    cache_path = os.path.splitext(path)[0] + "-remap-" + str(width) + ".npz"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        with np.load(cache_path) as data:
+            maps = (data['map1'], data['map2'], tuple(data['image_size']))
+    else:
+        calibration = load_calibration(path)
+        if 'image_size' not in calibration:
+            raise ValueError(path + " has no image size, recreate it with tools/camera_calibration.py")
+        maps = build_remap(calibration, width) + (tuple(calibration['image_size']),)
+        np.savez(cache_path, map1=maps[0], map2=maps[1], image_size=maps[2])
+
+    remap_cache[key] = maps
+    return maps
+
+def clear_remap_cache():
+    ''' Drops the in memory maps once a new configuration is loaded '''
+    remap_cache.clear()
+
+add_parameter_listener(clear_remap_cache)
+
+def rectify(img, width=250, path=None):
+    '''
+    Undistorts, rectifies, crops and scales a raw frame in one remap with
+    the calibration at path, which defaults to CALIBRATION_FILE.
+    '''
+    if path is None:
+        path = global_parameters['CALIBRATION_FILE']
+    map1, map2, image_size = get_remap(path, width)
+    if (img.shape[1], img.shape[0]) != tuple(int(v) for v in image_size):
+        raise ValueError("Frame is " + str(img.shape[1]) + "x" + str(img.shape[0]) + " px but " + path + \
+            " was calibrated at " + str(int(image_size[0])) + "x" + str(int(image_size[1])) + " px")
+    return cv2.remap(img, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+
+from . import bounding_box
+from ..global_parameters import global_parameters
+
+class DetectionGate:
+    '''
+        Cheap check run before the full detection pipeline. The frame is
+        decimated by GATE_STRIDE and only colour masked, without any
+        morphology or contours. If the meat coloured area is below
+        GATE_AREA_FRACTION of MINIMUM_AREA no piece can be found in it and
+        detection is skipped.
+
+        The number of frames checked and skipped and the time spent in the
+        gate itself are kept for get_metrics.
+    '''
+    def __init__(self, stride=None, area_fraction=None):
+        if stride is None:
+            stride = global_parameters['GATE_STRIDE']
+        if area_fraction is None:
+            area_fraction = global_parameters['GATE_AREA_FRACTION']
+
+        self.stride = stride
+        self.area_fraction = area_fraction
+        self.frames = 0
+        self.skipped = 0
+        self.gate_time = 0
+
+    def __repr__(self):
+        metrics = self.get_metrics()
+        return "DetectionGate Object\n\tFrames: " + str(metrics['frames']) + "\n\tSkip ratio: " + \
+            str(round(metrics['skip_ratio'], 3)) + "\n\tGate time: " + str(round(metrics['gate_ms'], 3)) + "ms/frame"
+
+    def check(self, img):
+        ''' Returns True if img (a scaled frame or band) needs full detection '''
+        start = time.perf_counter()
+
+        small = img[::self.stride, ::self.stride]
+        mask = bounding_box.gen_mask(small, process=False)
+        area = np.count_nonzero(mask) * self.stride**2
+        ret = area >= self.area_fraction * global_parameters['MINIMUM_AREA']
+
+        self.gate_time += time.perf_counter() - start
+        self.frames += 1
+        if not ret:
+            self.skipped += 1
+        return ret
+
+    def get_metrics(self):
+        return {
+            "frames" : self.frames,
+            "skipped" : self.skipped,
+            "skip_ratio" : self.skipped / max(self.frames, 1),
+            "gate_ms" : self.gate_time / max(self.frames, 1) * 1000
+        }
+
+    def reset(self):
+        self.frames = 0
+        self.skipped = 0
+        self.gate_time = 0
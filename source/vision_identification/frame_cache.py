@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+import cv2
+
+from . import bounding_box
+from ..global_parameters import global_parameters
+
+'''
+    Decodes a recorded video once so that later runs read frames straight
+    from a memory map instead of the codec. A cache is two files:
+
+        <cache path>.frames     Every frame back to back as uint8 N x H x W x 3
+        <cache path>.npz        Index holding the array shape, the time of
+                                every frame in ms into the video, the fps
+                                and the scaling the frames were built with
+
+    Frames may be scaled with bounding_box.scale while the cache is built,
+    which keeps it small (a raw 1080p frame is ~6MB) and leaves scale with
+    nothing to do when the frames are read back at the same width.
+'''
+
+def get_cache_path(video_path, width=None):
+    ''' Returns the default cache path for a video, next to the video itself '''
+    return os.path.splitext(video_path)[0] + "-cache-" + ("raw" if width is None else str(width))
+
+def get_scaling(width=None, method=None):
+    '''
+    Returns the scale method, calibration file and its modification time a
+    cache built at width with method would be scaled with, as strings. 
+    '''
+    if width is None:
+        return {"scale_method" : "", "calibration_file" : "", "calibration_time" : ""}
+    if method is None:
+        method = global_parameters['SCALE_METHOD']
+    path = global_parameters['CALIBRATION_FILE']
+    if path is None:
+        return {"scale_method" : method, "calibration_file" : "", "calibration_time" : ""}
+    # Calibrated frames are remapped instead of scaled
+    return {"scale_method" : "", "calibration_file" : path, \
+        "calibration_time" : str(os.path.getmtime(path)) if os.path.exists(path) else ""}
+
+def build_cache(video_path, width=None, cache_path=None, method=None, count=None):
+    '''
+    Decodes up to count frames (defaults to all) of video_path into a cache,
+    scaling them to width with the given scale method if width is set.
+    Returns the cache path, None if no frames could be read.
+    '''
+    if cache_path is None:
+        cache_path = get_cache_path(video_path, width)
+
+    # Nothing is written until the video has given a frame
+    cap = cv2.VideoCapture(video_path)
+    grabbed, frame = cap.read() if cap.isOpened() else (False, None)
+    if not grabbed:
+        print("ERROR: No frames could be read from", video_path)
+        cap.release()
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    times = []
+    shape = None
+
+    with open(cache_path + ".frames", "wb") as f:
+        while grabbed and (count is None or len(times) < count):
+            if width is not None:
+                frame = bounding_box.scale(frame, width, method=method)
+
+            if shape is None:
+                shape = frame.shape
+            elif frame.shape != shape:
+                print("ERROR: Frame size changed at frame", len(times), "of", video_path)
+                break
+
+            f.write(np.ascontiguousarray(frame).data)
+            times += [cap.get(cv2.CAP_PROP_POS_MSEC)]
+            grabbed, frame = cap.read()
+    cap.release()
+
+    np.savez(cache_path + ".npz", shape=np.array((len(times),) + shape), times=np.array(times), fps=fps, \
+        **get_scaling(width, method))
+    return cache_path
+
+def is_stale(cache_path, video_path, width=None):
+    ''' Whether a cache is missing, older than its video or scaled differently than it would be now '''
+    index = cache_path + ".npz"
+    if not os.path.exists(index):
+        return True
+    if os.path.exists(video_path) and os.path.getmtime(index) < os.path.getmtime(video_path):
+        return True
+    with np.load(index) as data:
+        # Caches from before the scaling was stored are rebuilt too
+        return any(key not in data.files or str(data[key]) != value for key, value in get_scaling(width).items())
+
+def open_cache(path, width=None, rebuild=False):
+    '''
+    Returns the FrameCache of a video at width, building it first if it is
+    missing, older than the video or was scaled with another SCALE_METHOD
+    or calibration. path may also be a cache path, which is opened as it 
+    is. Returns None if there is no cache and the video cannot be read.
+    '''
+    if os.path.exists(path + ".npz"):
+        return FrameCache(path)
+
+    cache_path = get_cache_path(path, width)
+    if rebuild or is_stale(cache_path, path, width):
+        if build_cache(path, width, cache_path) is None:
+            return None
+    return FrameCache(cache_path)
+
+class FrameCache:
+    '''
+        Frames of a cache built by build_cache. Indexing returns a view of
+        a copy on write memory map, so reading a frame copies nothing and
+        drawing on one never changes the file.
+
+        It can also stand in for a cv2.VideoCapture (grab, retrieve, read,
+        get, set, isOpened and release), so it can be passed to a
+        TriggeredCapture, decode_to_ring or any tool reading a capture.
+    '''
+    def __init__(self, cache_path):
+        with np.load(cache_path + ".npz") as index:
+            shape = tuple(int(x) for x in index['shape'])
+            self.times = index['times']
+            self.fps = float(index['fps'])
+
+        self.path = cache_path
+        self.frames = np.memmap(cache_path + ".frames", dtype=np.uint8, mode="c", shape=shape)
+        self.pos = 0 # Next frame grabbed
+        self.current = -1 # Last frame grabbed
+
+    def __repr__(self):
+        return "FrameCache Object\n\tPath: " + self.path + "\n\tFrames: " + str(len(self)) + "\n\tShape: " + str(self.frames.shape[1:])
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+    def __getitem__(self, i):
+        return self.frames[i]
+
+    def grab(self):
+        if self.frames is None or self.pos >= len(self):
+            return False
+        self.current = self.pos
+        self.pos += 1
+        return True
+
+    def retrieve(self, image=None):
+        ''' Returns the last frame grabbed, copied into image if one of the same shape is given '''
+        if self.frames is None or self.current < 0:
+            return False, None
+        frame = self.frames[self.current]
+        if image is not None and image.shape == frame.shape:
+            image[...] = frame
+            return True, image
+        return True, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def more(self):
+        return self.frames is not None and self.pos < len(self)
+
+    def isOpened(self):
+        return self.frames is not None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frames.shape[1]
+        elif prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frames.shape[2]
+        elif prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        elif prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.pos
+        elif prop == cv2.CAP_PROP_POS_MSEC:
+            return self.times[self.current] if self.current >= 0 else 0
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES and 0 <= value <= len(self):
+            self.pos = int(value)
+            return True
+        return False
+
+    def release(self):
+        # The map is closed once the last view of it is dropped
+        self.frames = None
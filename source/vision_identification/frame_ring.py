@@ -0,0 +1,157 @@
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Header words before the frame slots
+WRITTEN = 0 # Number of frames committed by the decoder
+CLOSED = 1 # Set once the decoder has no more frames
+STOP = 2 # Set by the consumer to ask the decoder to stop
+HEADER_SIZE = 4
+
+class FrameRing:
+    '''
+        Fixed ring of preallocated frame slots shared by one decoder and one
+        consumer. Frames are decoded straight into a slot and read back as a
+        view of it, so they are never copied, queued or pickled.
+
+        The decoder calls get_slot, fills the slot in place and calls commit.
+        read returns the oldest committed frame, which stays valid until the
+        next call to read.
+
+        With shared=True the slots live in multiprocessing.shared_memory and
+        the ring can be passed to a multiprocessing.Process as an argument,
+        letting the decoder run in its own process.
+    '''
+    def __init__(self, shape, slots=16, dtype=np.uint8, shared=False):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        self.shared = shared
+
+        self.write_count = 0 # Decoder side
+        self.read_count = 0 # Consumer side
+        self.holding = False
+        self.seq = -1
+        self.timestamp = 0
+
+        if shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.get_size())
+            self.owner = True
+            self.free = multiprocessing.Semaphore(slots)
+            self.filled = multiprocessing.Semaphore(0)
+            self.attach(self.shm.buf)
+        else:
+            self.shm = None
+            self.owner = False
+            self.free = threading.Semaphore(slots)
+            self.filled = threading.Semaphore(0)
+            self.attach(bytearray(self.get_size()))
+
+    def __repr__(self):
+        return "FrameRing Object\n\tSlots: " + str(self.slots) + "\n\tShape: " + str(self.shape) + \
+            "\n\tWritten: " + str(self.header[WRITTEN]) + "\n\tRead: " + str(self.read_count)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Views are rebuilt from the shared memory block in the other process
+        for key in ["header", "seqs", "times", "frames"]:
+            del state[key]
+        state["owner"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach(self.shm.buf)
+
+    def get_size(self):
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        return 8 * HEADER_SIZE + 16 * self.slots + frame_bytes * self.slots
+
+    def attach(self, buf):
+        ''' Builds the header, sequence number, timestamp and frame views over buf '''
+        pos = 0
+        self.header = np.ndarray([HEADER_SIZE], dtype=np.int64, buffer=buf, offset=pos)
+        pos += 8 * HEADER_SIZE
+        self.seqs = np.ndarray([self.slots], dtype=np.int64, buffer=buf, offset=pos)
+        pos += 8 * self.slots
+        self.times = np.ndarray([self.slots], dtype=np.float64, buffer=buf, offset=pos)
+        pos += 8 * self.slots
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=buf, offset=pos)
+
+    ### Decoder side ###
+
+    def get_slot(self, timeout=None):
+        ''' Blocks until a slot is free and returns it to be filled, None on timeout '''
+        if not self.free.acquire(timeout=timeout):
+            return None
+        return self.frames[self.write_count % self.slots]
+
+    def commit(self, timestamp):
+        ''' Publishes the slot last returned by get_slot '''
+        i = self.write_count % self.slots
+        self.seqs[i] = self.write_count
+        self.times[i] = timestamp
+        self.write_count += 1
+        self.header[WRITTEN] = self.write_count
+        self.filled.release()
+
+    def close(self):
+        ''' Marks the end of the stream and wakes the consumer '''
+        self.header[CLOSED] = 1
+        self.filled.release()
+
+    def stop_requested(self):
+        return self.header[STOP] != 0
+
+    ### Consumer side ###
+
+    def read(self, timeout=None):
+        '''
+            Returns a view of the oldest unread frame, blocking until one is
+            committed. The previous frame's slot is handed back to the decoder,
+            so copy a frame if it has to outlive the next call. Returns None
+            once the stream is closed and drained, or on timeout.
+        '''
+        if self.holding:
+            self.free.release()
+            self.holding = False
+
+        if self.read_count >= self.header[WRITTEN] and self.header[CLOSED]:
+            return None
+        if not self.filled.acquire(timeout=timeout):
+            return None
+        if self.read_count >= self.header[WRITTEN]:
+            # Woken by close rather than a frame, leave the wake up for any later read
+            self.filled.release()
+            return None
+
+        i = self.read_count % self.slots
+        self.seq = int(self.seqs[i])
+        self.timestamp = float(self.times[i])
+        self.read_count += 1
+        self.holding = True
+        return self.frames[i]
+
+    def more(self):
+        return self.header[WRITTEN] - self.read_count > 0
+
+    def finished(self):
+        ''' True once the stream is closed and every frame has been read '''
+        return bool(self.header[CLOSED]) and not self.more()
+
+    def stop(self):
+        ''' Asks the decoder to stop and frees a slot in case it is waiting on one '''
+        self.header[STOP] = 1
+        self.free.release()
+
+    def release(self):
+        ''' Frees the shared memory block, frames read from the ring are invalid afterwards '''
+        if self.shm is None:
+            return
+        del self.header, self.seqs, self.times, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
@@ -5,10 +5,70 @@ import cv2
 
 from ..model.point import Point 
 from ..global_parameters import global_parameters
-from .. import vector_tools
 
 font = cv2.FONT_HERSHEY_SIMPLEX
 
+# Corner index pairs of the two long sides of a box for each ordering of its 
+# corner distances, see gen_batch_lines 
+LONG_LINE_INDECES = np.array([
+    [[1, 2], [0, 3]], # Corner 1 furthest, corner 2 closest 
+    [[1, 3], [0, 2]], # Corner 1 furthest
+    [[1, 2], [0, 3]], # Corner 2 furthest, corner 1 closest 
+    [[2, 3], [0, 1]], # Corner 2 furthest
+    [[1, 3], [0, 2]], # Corner 3 furthest, corner 1 closest 
+    [[0, 1], [2, 3]]  # Corner 3 furthest
+])
+
+def gen_batch_lines(boxes, sides):
+    '''
+    Finds the width, loin line, cut line and loin line angle of N pieces
+    at once from an (N, 4, 2) array of boxPoints and their sides ("Left" or
+    "Right"). Returns arrays of shape (N), (N, 2, 2), (N, 2, 2) and (N).
+
+    The short side is the closest corner to corner 0 and the long sides 
+    are picked from the furthest one. The loin is the lower long side of a
+    Left piece and the upper one of a Right piece. The cut line is the loin
+    line moved LOIN_WIDTH into the piece. 
+    '''
+    boxes = np.asarray(boxes)
+    n = len(boxes)
+    left = np.array([side == "Left" for side in sides], dtype=bool)
+
+    diff = boxes[:,1:] - boxes[:,0:1]
+    dists = diff[:,:,0]**2 + diff[:,:,1]**2
+    max_distance = dists.max(axis=1)
+    min_distance = dists.min(axis=1)
+    widths = min_distance ** 0.5
+
+    # Ties resolve in the same order as the original comparisons 
+    max_1 = dists[:,0] == max_distance
+    max_2 = ~max_1 & (dists[:,1] == max_distance)
+    min_1 = dists[:,0] == min_distance
+    min_2 = dists[:,1] == min_distance
+    case = np.where(max_1, np.where(min_2, 0, 1), np.where(max_2, np.where(min_1, 2, 3), np.where(min_1, 4, 5)))
+    long_lines = boxes[np.arange(n)[:,None,None], LONG_LINE_INDECES[case]] # (N, 2 sides, 2 corners, 2)
+
+    long_avg_y = (long_lines[:,:,0,1] + long_lines[:,:,1,1]) / 2
+    first = (long_avg_y[:,0] > long_avg_y[:,1]) == left
+    loin_lines = np.where(first[:,None,None], long_lines[:,0], long_lines[:,1])
+
+    # Unit normal of each loin line, pointing into the piece
+    k = loin_lines[:,0] - loin_lines[:,1]
+    k = k / np.linalg.norm(k, axis=1)[:,None]
+    normals = np.stack([k[:,1], -1*k[:,0]], axis=1)
+    normals[left] *= -1
+    cut_lines = loin_lines + (normals * global_parameters['LOIN_WIDTH'] * global_parameters['VIDEO_SCALE'])[:,None]
+
+    # Same convention as Point.vector_angle 
+    dx = (loin_lines[:,1,0] - loin_lines[:,0,0]).astype(float)
+    dy = (loin_lines[:,1,1] - loin_lines[:,0,1]).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angles = np.degrees(np.arctan(-1*dy / dx))
+    angles = np.where(dx < 0, (angles + 180 + 360) % 360, (angles + 360) % 360)
+    angles = np.where(dx == 0, np.where(dy < 0, 90, 270), angles)
+
+    return widths, loin_lines, cut_lines, angles
+
 class Meat():
     def __init__(self, data, conveyor_speed=global_parameters['CONVEYOR_SPEED'] * global_parameters['RUNTIME_FACTOR'], side="Left", center=(0,0)):
         self.conveyor_speed = conveyor_speed
@@ -17,7 +77,7 @@ class Meat():
         self.center = center
         self.width = 0
 
-        if (self.bbox == []):
+        if (len(self.bbox) == 0):
             print("ERR: Meat object created with empty bbox.")
         else:
             self.gen_significant_lines()
@@ -44,82 +104,39 @@ class Meat():
 
         # self.lines = [self.loin_line, self.shoulder_line, self.ham_line, self.belly_line, self.cut_line]
 
-    def gen_significant_lines(self):
+    @classmethod
+    def from_batch(cls, boxes, sides, centers, conveyor_speed=global_parameters['CONVEYOR_SPEED'] * global_parameters['RUNTIME_FACTOR']):
+        '''
+        Creates a Meat for every box of an (N, 4, 2) array in one pass of
+        gen_batch_lines. Their arrays are views into the batch results. 
+        '''
+        boxes = np.asarray(boxes)
+        widths, loin_lines, cut_lines, angles = gen_batch_lines(boxes, sides)
+
+        ret = []
+        for i in range(0, len(boxes)):
+            temp = cls.__new__(cls)
+            temp.conveyor_speed = conveyor_speed
+            temp.side = sides[i]
+            temp.bbox = boxes[i]
+            temp.center = centers[i]
+            temp.width = widths[i]
+            temp.loin_line = loin_lines[i]
+            temp.cut_line = cut_lines[i]
+            temp.angle = angles[i]
+            ret += [temp]
+        return ret
 
-        # One will be short, one medium, one long
-        dist1 = (self.bbox[1] - self.bbox[0])[0]**2 + (self.bbox[1] - self.bbox[0])[1]**2
-        dist2 = (self.bbox[2] - self.bbox[0])[0]**2 + (self.bbox[2] - self.bbox[0])[1]**2
-        dist3 = (self.bbox[3] - self.bbox[0])[0]**2 + (self.bbox[3] - self.bbox[0])[1]**2
-        max_distance = max(dist1, dist2, dist3)
-        min_distance = min(dist1, dist2, dist3)
-        self.width = min_distance ** 0.5
-
-        if max_distance == dist1:
-            if min_distance == dist2:
-                long_line_indeces = [[1, 2], [0, 3]]
-                # short_line_indeces = [[0, 2], [1, 3]]
-            else:
-                long_line_indeces = [[1, 3], [0, 2]]
-                # short_line_indeces = [[0, 3], [1, 2]]
-        elif max_distance == dist2:
-            if min_distance == dist1:
-                long_line_indeces = [[1, 2], [0, 3]]
-                # short_line_indeces = [[0, 1], [2, 3]]
-            else:
-                long_line_indeces = [[2, 3], [0, 1]]
-                # short_line_indeces = [[0, 3], [1, 2]]
-        else:
-            if min_distance == dist1:
-                long_line_indeces = [[1, 3], [0, 2]]
-                # short_line_indeces = [[0, 1], [2, 3]]
-            else:
-                long_line_indeces = [[0, 1], [2, 3]]
-                # short_line_indeces = [[0, 2], [1, 3]]
-
-        # short_avg_x_0 = (self.bbox[short_line_indeces[0][0]][0] + self.bbox[short_line_indeces[0][1]][0])/2
-        # short_avg_x_1 = (self.bbox[short_line_indeces[1][0]][0] + self.bbox[short_line_indeces[1][1]][0])/2
-
-        # if short_avg_x_0 > short_avg_x_1:
-        #     self.ham_line = [self.bbox[short_line_indeces[0][0]], self.bbox[short_line_indeces[0][1]]]
-        #     self.shoulder_line = [self.bbox[short_line_indeces[1][0]], self.bbox[short_line_indeces[1][1]]]
-        # else:
-        #     self.shoulder_line = [self.bbox[short_line_indeces[0][0]], self.bbox[short_line_indeces[0][1]]]
-        #     self.ham_line = [self.bbox[short_line_indeces[1][0]], self.bbox[short_line_indeces[1][1]]]
-
-        long_avg_y_0 = (self.bbox[long_line_indeces[0][0]][1] + self.bbox[long_line_indeces[0][1]][1])/2
-        long_avg_y_1 = (self.bbox[long_line_indeces[1][0]][1] + self.bbox[long_line_indeces[1][1]][1])/2
-    
-        if long_avg_y_0 > long_avg_y_1:
-            if self.side == "Left":
-                # self.belly_line = [self.bbox[long_line_indeces[1][0]], self.bbox[long_line_indeces[1][1]]]
-                self.loin_line = [self.bbox[long_line_indeces[0][0]], self.bbox[long_line_indeces[0][1]]]
-            else:
-                # self.belly_line = [self.bbox[long_line_indeces[0][0]], self.bbox[long_line_indeces[0][1]]]
-                self.loin_line = [self.bbox[long_line_indeces[1][0]], self.bbox[long_line_indeces[1][1]]]
-        else:
-            if self.side == "Left":
-                # self.belly_line = [self.bbox[long_line_indeces[0][0]], self.bbox[long_line_indeces[0][1]]]
-                self.loin_line = [self.bbox[long_line_indeces[1][0]], self.bbox[long_line_indeces[1][1]]]
-            else:
-                # self.belly_line = [self.bbox[long_line_indeces[1][0]], self.bbox[long_line_indeces[1][1]]]
-                self.loin_line = [self.bbox[long_line_indeces[0][0]], self.bbox[long_line_indeces[0][1]]]
-
-        x = vector_tools.get_normal_unit(self.loin_line[0], self.loin_line[1])
-        
-        if self.side == "Left":
-            x *= -1
-
-        dir_vect = x * global_parameters['LOIN_WIDTH'] * global_parameters['VIDEO_SCALE']
-        self.cut_line = self.loin_line + dir_vect
-
-        # Return 
-        # self.lines = [self.loin_line, self.shoulder_line, self.ham_line, self.belly_line, self.cut_line]
+    def gen_significant_lines(self):
+        widths, loin_lines, cut_lines, angles = gen_batch_lines(np.asarray(self.bbox)[None], [self.side])
+        self.width = widths[0]
+        self.loin_line = loin_lines[0]
+        self.cut_line = cut_lines[0]
+        self.angle = angles[0]
 
     def get_center_as_point(self):
-        dy = self.loin_line[1][1] - self.loin_line[0][1]
-        dx = self.loin_line[1][0] - self.loin_line[0][0]
-
-        return Point(self.center[0], self.center[1], angle=Point(dx, dy).vector_angle()) 
+        # Translating the piece never changes the angle of its loin line
+        return Point(self.center[0], self.center[1], angle=self.angle) 
 
     def get_lines(self):
         return self.lines
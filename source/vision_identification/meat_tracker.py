@@ -0,0 +1,137 @@
+import copy
+
+import numpy as np
+
+from ..global_parameters import global_parameters
+
+class MeatTracker:
+    '''
+        Tracks every piece on the conveyor in contiguous arrays instead of
+        stepping each Meat every frame. A piece is stored where it was seen
+        along with the frame it was seen on, and its position on any later
+        frame is that plus the conveyor travel since. step only advances the
+        frame counter, so tracking costs the same however many pieces are in
+        view.
+
+        Pieces are referred to by the id returned from add. Positions are in
+        the same pixels as the Meat they were added from.
+    '''
+    def __init__(self, conveyor_speed=None, capacity=16):
+        if conveyor_speed is None:
+            conveyor_speed = global_parameters['CONVEYOR_SPEED'] * global_parameters['RUNTIME_FACTOR']
+        self.conveyor_speed = conveyor_speed # px/frame
+        self.frame = 0
+        self.count = 0
+        self.next_id = 0
+
+        self.ids = np.empty([capacity], dtype=np.int64)
+        self.seen = np.empty([capacity]) # Frame each piece was seen on, fractional when stepped by elapsed time
+        self.centers = np.empty([capacity, 2])
+        self.bboxes = np.empty([capacity, 4, 2])
+        self.loin_lines = np.empty([capacity, 2, 2])
+        self.cut_lines = np.empty([capacity, 2, 2])
+        self.widths = np.empty([capacity])
+        self.meats = [] # Meat each row was added from, only used to rebuild one
+
+    def __repr__(self):
+        return "MeatTracker Object\n\tFrame: " + str(self.frame) + "\n\tPieces: " + str(self.count)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        ''' Doubles the capacity of every array '''
+        for key in ["ids", "seen", "centers", "bboxes", "loin_lines", "cut_lines", "widths"]:
+            old = getattr(self, key)
+            new = np.empty((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, key, new)
+
+    def add(self, meat):
+        ''' Starts tracking meat from the current frame and returns its id '''
+        if self.count == len(self.ids):
+            self.grow()
+
+        i = self.count
+        self.ids[i] = self.next_id
+        self.seen[i] = self.frame
+        self.centers[i] = meat.center
+        self.bboxes[i] = meat.bbox
+        self.loin_lines[i] = meat.loin_line
+        self.cut_lines[i] = meat.cut_line
+        self.widths[i] = meat.width
+        self.meats += [meat]
+
+        self.count += 1
+        self.next_id += 1
+        return self.next_id - 1
+
+    def step(self, frames=1):
+        ''' Advances every piece by the conveyor travel over a number of frames, which need not be whole '''
+        self.frame += frames
+
+    def get_offsets(self, frame=None):
+        ''' Returns the y distance every piece has travelled since it was seen '''
+        if frame is None:
+            frame = self.frame
+        return (frame - self.seen[:self.count]) * self.conveyor_speed
+
+    def position_at(self, frame=None):
+        ''' Returns the centers of every piece on a given frame, defaults to the current one '''
+        ret = self.centers[:self.count].copy()
+        ret[:,1] += self.get_offsets(frame)
+        return ret
+
+    def boxes_at(self, frame=None):
+        ''' Returns the bounding boxes of every piece on a given frame, defaults to the current one '''
+        ret = self.bboxes[:self.count].copy()
+        ret[:,:,1] += self.get_offsets(frame)[:,None]
+        return ret
+
+    def get_ids(self):
+        return self.ids[:self.count].copy()
+
+    def get_index(self, id):
+        index = np.flatnonzero(self.ids[:self.count] == id)
+        if len(index) == 0:
+            return None
+        return index[0]
+
+    def get_meat(self, id):
+        ''' Returns a Meat at the current position of a piece, None if it has expired '''
+        i = self.get_index(id)
+        if i is None:
+            return None
+
+        step_vec = np.array([0, self.get_offsets()[i]])
+        ret = copy.copy(self.meats[i])
+        ret.center = self.centers[i] + step_vec
+        ret.bbox = self.bboxes[i] + step_vec
+        ret.loin_line = self.loin_lines[i] + step_vec
+        ret.cut_line = self.cut_lines[i] + step_vec
+        return ret
+
+    def expire(self, limit=None):
+        '''
+            Stops tracking every piece whose center has passed limit (y px),
+            which defaults to the pickup point. Returns the expired ids.
+        '''
+        if limit is None:
+            limit = global_parameters['PICKUP_POINT'].y
+
+        keep = self.position_at()[:,1] <= limit
+        if keep.all():
+            return []
+
+        expired = self.ids[:self.count][~keep].tolist()
+        n = np.count_nonzero(keep)
+        for key in ["ids", "seen", "centers", "bboxes", "loin_lines", "cut_lines", "widths"]:
+            arr = getattr(self, key)
+            arr[:n] = arr[:self.count][keep]
+        self.meats = [self.meats[i] for i in np.flatnonzero(keep)]
+        self.count = n
+        return expired
+
+    def draw(self, img, color=(0, 255, 0)):
+        for id in self.get_ids():
+            self.get_meat(id).draw(img, color=color)
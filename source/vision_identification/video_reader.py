@@ -1,11 +1,97 @@
 from threading import Thread as worker
+from threading import Condition
+from multiprocessing import Process
 # from processing import process as worker
 import sys
 from queue import Queue
 import time
 
+import numpy as np
 import cv2
 
+from .frame_ring import FrameRing
+from . import frame_cache
+from ..global_parameters import global_parameters
+
+class TriggeredCapture:
+    '''
+        Wraps a cv2.VideoCapture so that every read only grabs the next 
+        frame, keeping the stream in sync, and the frame is only decoded
+        with retrieve when a trigger is pending or every subsample grabs. 
+        subsample defaults to GRAB_SUBSAMPLE, 0 only decodes triggered frames.
+
+        read returns (grabbed, frame) like cv2.VideoCapture.read, frame is
+        None when the frame was grabbed but not decoded. 
+    '''
+    def __init__(self, stream, subsample=None):
+        if isinstance(stream, str):
+            stream = cv2.VideoCapture(stream)
+        if subsample is None:
+            subsample = global_parameters['GRAB_SUBSAMPLE']
+
+        self.stream = stream
+        self.subsample = subsample
+        self.triggered = False
+        self.grabbed = 0
+        self.decoded = 0
+
+    def trigger(self):
+        ''' Decodes the next frame grabbed '''
+        self.triggered = True
+
+    def read(self, image=None, trigger=False):
+        if not self.stream.grab():
+            return False, None
+        self.grabbed += 1
+
+        if trigger or self.triggered or (self.subsample > 0 and self.grabbed % self.subsample == 0):
+            self.triggered = False
+            self.decoded += 1
+            return self.stream.retrieve(image)
+        return True, None
+
+    def isOpened(self):
+        return self.stream.isOpened()
+
+    def get(self, prop):
+        return self.stream.get(prop)
+
+    def release(self):
+        self.stream.release()
+
+def decode_to_ring(stream, ring, subsample=None):
+    '''
+        Decodes frames from stream (a cv2.VideoCapture, TriggeredCapture or 
+        a path to open one) straight into the slots of ring until the video 
+        ends or the ring is asked to stop. Runs on the decoder thread or 
+        process. A path is opened as a TriggeredCapture if subsample is set.
+    '''
+    if isinstance(stream, str):
+        stream = cv2.VideoCapture(stream)
+        if subsample is not None:
+            stream = TriggeredCapture(stream, subsample)
+
+    slot = None
+    while not ring.stop_requested():
+        if slot is None:
+            slot = ring.get_slot(timeout=0.1)
+            if slot is None:
+                continue
+
+        (grabbed, frame) = stream.read(slot)
+        if not grabbed:
+            break
+        if frame is None:
+            # Grabbed but not decoded, the slot is kept for the next frame
+            continue
+        if not np.shares_memory(frame, slot):
+            # Decoder could not write in place, e.g. the frame size changed 
+            slot[...] = frame
+        ring.commit(time.time())
+        slot = None
+
+    ring.close()
+
 class FileVideoStream:
     '''
         This allows the program to read the video on a separate thread than
@@ -15,16 +101,88 @@ class FileVideoStream:
         and if 0 queue size is reached it will kill the program. Change sleep_time
         manually based on queue size either on this thread or your other thread, 
         depending on which one is the limiting factor. 
+
+        buffer="ring" decodes frames on a thread into a FrameRing of queueSize
+        preallocated slots instead, and buffer="process" does the same from a
+        separate process through shared memory. Neither polls with sleep_time.
+        Frames returned by read are then views into the ring and are only
+        valid until the next read. 
+
+        buffer="latest" is for live cameras. Frames are read as fast as the
+        camera supplies them and only the newest is kept, so read always
+        returns the most recent image. Frames replaced before being read are
+        counted in dropped. 
+
+        buffer="cache" replays a recording from its frame cache (see
+        frame_cache.py), building the cache on the first run. No thread is 
+        used, read returns views of the memory mapped cache, and path may 
+        be the video or the cache itself. cache_width is the width the 
+        cached frames are scaled to, None keeps them raw. 
+
+        In every mode capture_time is the time the last frame returned by 
+        read was taken from the camera. 
+
+        If subsample is set frames are read through a TriggeredCapture, so 
+        only frames after a call to trigger (and every subsample frames, if 
+        not 0) are decoded and passed on. buffer="process" only supports 
+        subsampling. 
     '''
-    def __init__(self, path, queueSize=128):
-        self.stream = cv2.VideoCapture(path)
+    def __init__(self, path, queueSize=128, buffer="queue", subsample=None, cache_width=None):
+        if buffer == "cache":
+            self.stream = frame_cache.open_cache(path, cache_width)
+        else:
+            self.stream = cv2.VideoCapture(path)
+        self.subsample = subsample
         self.stopped = False
-        self.Q = Queue(maxsize=queueSize)
         self.sleep_time = 0.001
         self.running = False
+        self.buffer = buffer
+
+        self.capture_time = 0
+        self.dropped = 0
+        self.seq = -1
+
+        if buffer == "latest":
+            self.latest = None
+            self.latest_time = 0
+            self.latest_seq = -1
+            self.new_frame = Condition()
+            self.ring = None
+        elif buffer == "queue":
+            self.Q = Queue(maxsize=queueSize)
+            self.ring = None
+        elif buffer == "cache":
+            self.cache = self.stream
+            self.ring = None
+            if self.cache is None:
+                self.stopped = True
+        else:
+            shape = (int(self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+            self.ring = FrameRing(shape, slots=queueSize, shared=(buffer == "process"))
+            if buffer == "process":
+                # The decoder process opens its own capture
+                self.stream.release()
+                self.stream = path
+
+        if subsample is not None and buffer != "process" and not self.stopped:
+            self.stream = TriggeredCapture(self.stream, subsample)
 
     def start(self):
-        self.t = worker(target=self.update, args=())
+        if self.buffer == "cache":
+            # Frames are read from the cache on the calling thread
+            self.running = not self.stopped
+            return self
+        if self.buffer == "process":
+            self.t = Process(target=decode_to_ring, args=(self.stream, self.ring, self.subsample))
+            self.running = True
+        elif self.buffer == "ring":
+            self.t = worker(target=decode_to_ring, args=(self.stream, self.ring))
+            self.running = True
+        elif self.buffer == "latest":
+            self.t = worker(target=self.update_latest, args=())
+            self.running = True
+        else:
+            self.t = worker(target=self.update, args=())
         self.t.daemon = True
         self.t.start()
         return self
@@ -32,6 +190,11 @@ class FileVideoStream:
     def stop(self):
         self.stopped = True
         self.running = False
+        if self.ring is not None:
+            self.ring.stop()
+        if self.buffer == "latest":
+            with self.new_frame:
+                self.new_frame.notify_all()
 
     def update(self):
         self.running = True
@@ -46,11 +209,92 @@ class FileVideoStream:
                 if not grabbed:
                     self.stop()
                     return 
+                if frame is None: # Grabbed but not decoded
+                    continue
+
+                self.Q.put((frame, time.time()))
 
-                self.Q.put(frame)
+    def update_latest(self):
+        while not self.stopped:
+            (grabbed, frame) = self.stream.read()
+            capture_time = time.time()
+
+            if not grabbed:
+                self.stop()
+                return
+            if frame is None: # Grabbed but not decoded
+                continue
+
+            with self.new_frame:
+                self.latest = frame
+                self.latest_time = capture_time
+                self.latest_seq += 1
+                self.new_frame.notify()
+
+    def trigger(self):
+        ''' Has the next frame grabbed decoded, requires subsample to be set '''
+        if self.subsample is None or self.buffer == "process":
+            print("ERROR: Triggers need a subsample and a thread buffer")
+            return
+        self.stream.trigger()
 
     def read(self):
-        return self.Q.get()
+        if self.buffer == "latest":
+            return self.read_latest()
+        if self.buffer == "cache":
+            return self.read_cache()
+        if self.ring is not None:
+            frame = self.ring.read()
+            self.capture_time = self.ring.timestamp
+            if self.ring.finished():
+                self.running = False
+            return frame
+        (frame, self.capture_time) = self.Q.get()
+        return frame
+
+    def read_latest(self):
+        ''' Waits for a frame newer than the last one read, None once stopped '''
+        with self.new_frame:
+            while self.latest_seq <= self.seq and not self.stopped:
+                self.new_frame.wait()
+            if self.latest_seq <= self.seq:
+                return None
+
+            self.dropped += self.latest_seq - self.seq - 1
+            self.seq = self.latest_seq
+            self.capture_time = self.latest_time
+            return self.latest
+
+    def read_cache(self):
+        ''' Returns the next frame (decoded, if subsampling) as a view of the cache, None at the end '''
+        while not self.stopped:
+            (grabbed, frame) = self.stream.read()
+            if not grabbed:
+                self.stop()
+                return None
+            if frame is not None:
+                self.capture_time = time.time()
+                return frame
+        return None
+
+    def get_frame_age(self):
+        ''' Returns how long ago the last frame returned by read was captured '''
+        return time.time() - self.capture_time
 
     def more(self):
-        return self.Q.qsize() > 0
\ No newline at end of file
+        if self.buffer == "cache":
+            return not self.stopped and self.cache.more()
+        if self.buffer == "latest":
+            return self.latest_seq > self.seq
+        if self.ring is not None:
+            return self.ring.more()
+        return self.Q.qsize() > 0
+
+    def release(self):
+        ''' Stops the decoder and frees the ring, frames already read become invalid '''
+        self.stop()
+        if self.ring is not None:
+            self.t.join()
+            self.ring.release()
+        elif self.buffer == "cache" and self.cache is not None:
+            self.cache.release()
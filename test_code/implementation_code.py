@@ -7,6 +7,7 @@ from context import source
 from source.vision_identification import bounding_box
 from source.vision_identification.video_reader import FileVideoStream
 from source.vision_identification import meat
+from source.vision_identification.meat_tracker import MeatTracker
 from source.model.robot import Robot
 from source.model.point import Point
 from source.path_planning.path_runner import PathRunner
@@ -21,6 +22,8 @@ from source.global_parameters import global_parameters
 DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
 DISPLAY_TOGGLE = True
 PROFILER_TOGGLE = True
+LIVE_TOGGLE = False # Set for a live camera, only the newest frame is processed
+CACHE_TOGGLE = True # Replays the recording from its frame cache instead of decoding it
 
 # Model for creating acceleration profiles
 if PROFILER_TOGGLE:
@@ -32,7 +35,12 @@ if DISPLAY_TOGGLE:
     current_graph = np.zeros([830, 830, 3], dtype=np.uint8)
     grapher = graphing_tools.Grapher()
 
-streamer = FileVideoStream(DATA_PATH)
+if LIVE_TOGGLE:
+    streamer = FileVideoStream(DATA_PATH, buffer="latest")
+elif CACHE_TOGGLE:
+    streamer = FileVideoStream(DATA_PATH, buffer="cache", cache_width=250)
+else:
+    streamer = FileVideoStream(DATA_PATH)
 streamer.start()
 time.sleep(1) 
 
@@ -54,11 +62,14 @@ def main(data_path=DATA_PATH):
     flip_flop = False 
     flip_flop2 = False
 
-    meats = [0]
+    meats = [None] # Tracker ids
+    tracker = MeatTracker()
     queue1 = []
     queue2 = []
     times = []
+    ages = [] # Age of each live frame when it was processed
     saved_state = []
+    last_time = None # Capture time of the last frame
 
     while(streamer.running):
         start = time.time()
@@ -69,20 +80,31 @@ def main(data_path=DATA_PATH):
         force_timer = time.time()
 
         # Keeps streamer queue size within a lag free range (>0 and <128)
-        qsize = streamer.Q.qsize()
-        if qsize < 40:
-            streamer.sleep_time = 0
-        elif qsize > 88:
-            streamer.sleep_time = 0.005
+        if streamer.buffer == "queue":
+            qsize = streamer.Q.qsize()
+            if qsize < 40:
+                streamer.sleep_time = 0
+            elif qsize > 88:
+                streamer.sleep_time = 0.005
         
         # frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
         temp = streamer.read()
+        if temp is None:
+            break
         frame = bounding_box.scale(temp)
-        frame = cv2.copyMakeBorder(frame, 0, 300, 300, 300, cv2.BORDER_CONSTANT, value=0)
 
-        iH, iW, iD = frame.shape
-        box, _, _ = bounding_box.get_bbox(frame)
+        # A live camera drops frames, so pieces are moved on by the time between captures
+        if LIVE_TOGGLE:
+            if last_time is not None:
+                tracker.step((streamer.capture_time - last_time) * global_parameters['FRAME_RATE'])
+            last_time = streamer.capture_time
+            ages += [streamer.get_frame_age()]
+
+        # Boxes are found on the camera frame and offset onto the robot canvas
+        canvas_shape = bounding_box.get_canvas_shape(frame)
+        iH, iW, iD = canvas_shape
+        box, _, _ = bounding_box.get_bbox(frame, frame_shape=canvas_shape, offset=bounding_box.get_canvas_offset())
 
         # for i in range(0, len(box)):
         #     cv2.drawContours(frame, [box[i][0]], 0, (255, 255, 255), 3)
@@ -96,9 +118,9 @@ def main(data_path=DATA_PATH):
 
                     if iH / 3 - 5 < cY and iH / 3 + 5 > cY:
                         if flip_flop:
-                            meats += [meat.Meat(box[i], side="Right", center=[cX, cY])]
+                            meats += [tracker.add(meat.Meat(box[i], side="Right", center=[cX, cY]))]
                         else:
-                            meats += [meat.Meat(box[i], side="Left", center=[cX, cY])]
+                            meats += [tracker.add(meat.Meat(box[i], side="Left", center=[cX, cY]))]
                         flip_flop = not flip_flop
                         delay = 0
 
@@ -120,13 +142,15 @@ def main(data_path=DATA_PATH):
         # # Profiler model creates motion profiles, it updates as fast as possible in a separate thread
         if PROFILER_TOGGLE:
             if profile_model.phase == 0 and len(queue1) > 0 and not path_runner.running:
-                dist = (global_parameters['PICKUP_POINT'] - meats[queue1[0][0]].get_center_as_point()).y
+                m1, m2 = tracker.get_meat(meats[queue1[0][0]]), tracker.get_meat(meats[queue1[0][1]])
+                # Expired pieces have already passed the pickup point
+                dist = 0 if m1 is None or m2 is None else (global_parameters['PICKUP_POINT'] - m1.get_center_as_point()).y
 
                 if dist > 0:
-                    sp1 = meats[queue1[0][0]].get_center_as_point().copy() + Point(0, dist)
-                    sp2 = meats[queue1[0][1]].get_center_as_point().copy() + Point(0, dist)
+                    sp1 = m1.get_center_as_point().copy() + Point(0, dist)
+                    sp2 = m2.get_center_as_point().copy() + Point(0, dist)
                     profile_model.move_meat(sp1, sp2, ep1, ep2, dist // global_parameters['CONVEYOR_SPEED'], \
-                        meats[queue1[0][0]].width, meats[queue1[0][1]].width, phase_1_delay=False)
+                        m1.width, m2.width, phase_1_delay=False)
                     queue1 = queue1[1:]
 
                     # Given the start and end conditions, calculate the profile_model motor profiles
@@ -135,13 +159,14 @@ def main(data_path=DATA_PATH):
         # Drawing model is just for drawing purposes, it updates at the frame rate displayed
         if DISPLAY_TOGGLE:
             if drawing_model.phase == 0 and len(queue2) > 0:
-                dist = (global_parameters['PICKUP_POINT'] - meats[queue2[0][0]].get_center_as_point()).y
+                m1, m2 = tracker.get_meat(meats[queue2[0][0]]), tracker.get_meat(meats[queue2[0][1]])
+                dist = 0 if m1 is None or m2 is None else (global_parameters['PICKUP_POINT'] - m1.get_center_as_point()).y
 
                 if dist > 0:
-                    sp1 = meats[queue2[0][0]].get_center_as_point().copy() + Point(0, dist)
-                    sp2 = meats[queue2[0][1]].get_center_as_point().copy() + Point(0, dist)
+                    sp1 = m1.get_center_as_point().copy() + Point(0, dist)
+                    sp2 = m2.get_center_as_point().copy() + Point(0, dist)
                     drawing_model.move_meat(sp1, sp2, ep1, ep2, dist // (global_parameters['CONVEYOR_SPEED'] * \
-                        global_parameters['RUNTIME_FACTOR']), meats[queue2[0][0]].width, meats[queue2[0][1]].width)
+                        global_parameters['RUNTIME_FACTOR']), m1.width, m2.width)
                     queue2 = queue2[1:]
                     flip_flop2 = True
                     if PROFILER_TOGGLE:
@@ -162,9 +187,8 @@ def main(data_path=DATA_PATH):
         ###############        
         
         if DISPLAY_TOGGLE:
-            if (len(meats) != 1):
-                for i in range(1, len(meats)):
-                    meats[i].draw(frame, color=(255, 255, 0))
+            frame = bounding_box.pad_to_canvas(frame)
+            tracker.draw(frame, color=(255, 255, 0))
             drawing_model.draw(frame)
 
             if PROFILER_TOGGLE:
@@ -175,8 +199,9 @@ def main(data_path=DATA_PATH):
         ### Controls ###
         ################
 
-        for i in range(1, len(meats)):
-            meats[i].step()
+        if not LIVE_TOGGLE:
+            tracker.step()
+        tracker.expire()
 
         if DISPLAY_TOGGLE:
             # k = cv2.waitKey(1) & 0xFF
@@ -210,6 +235,9 @@ def main(data_path=DATA_PATH):
         
 
     print("Average frame time:", np.average(times))
+    if LIVE_TOGGLE:
+        print("Dropped frames:", streamer.dropped)
+        print("Average frame age:", np.average(ages))
     # out.release()
     streamer.stop()
     if PROFILER_TOGGLE:
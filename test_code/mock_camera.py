@@ -11,6 +11,7 @@ from context import source
 from source.vision_identification import bounding_box
 from source.vision_identification.video_reader import FileVideoStream
 from source.vision_identification import meat
+from source.vision_identification.meat_tracker import MeatTracker
 from source.model.robot import Robot
 from source.model.point import Point
 from source.path_planning.path_runner import PathRunner
@@ -24,8 +25,12 @@ client_socket.setblocking(False) # makes receive non blocking
 
 DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
 DISPLAY_TOGGLE = True
+GRAB_TOGGLE = False # Only decodes frames triggered over the socket (and every GRAB_SUBSAMPLE frames)
 
-streamer = FileVideoStream(DATA_PATH)
+if GRAB_TOGGLE:
+    streamer = FileVideoStream(DATA_PATH, subsample=global_parameters['GRAB_SUBSAMPLE'])
+else:
+    streamer = FileVideoStream(DATA_PATH)
 streamer.start()
 time.sleep(1) 
 
@@ -41,7 +46,8 @@ def main(data_path=DATA_PATH):
     flip_flop = False 
     flip_flop2 = False
 
-    meats = [0]
+    meats = [None] # Tracker ids
+    tracker = MeatTracker()
     queue1 = []
     queue2 = []
     times = []
@@ -61,12 +67,27 @@ def main(data_path=DATA_PATH):
         elif qsize > 88:
             streamer.sleep_time = 0.005
 
+        if GRAB_TOGGLE:
+            # Any message from the server acts as the camera trigger
+            try:
+                if client_socket.recv(1024):
+                    streamer.trigger()
+            except IOError as e:
+                if e.errno != errno.EAGAIN and e.errno != errno.EWOULDBLOCK:
+                    print("ERROR: Reading error", str(e))
+                    sys.exit()
+
+            if not streamer.more():
+                time.sleep(0.001)
+                continue
+
         temp = streamer.read()
         frame = bounding_box.scale(temp)
-        frame = cv2.copyMakeBorder(frame, 0, 300, 300, 300, cv2.BORDER_CONSTANT, value=0)
 
-        iH, iW, iD = frame.shape
-        box, _, _ = bounding_box.get_bbox(frame)
+        # Boxes are found on the camera frame and offset onto the robot canvas
+        canvas_shape = bounding_box.get_canvas_shape(frame)
+        iH, iW, iD = canvas_shape
+        box, _, _ = bounding_box.get_bbox(frame, frame_shape=canvas_shape, offset=bounding_box.get_canvas_offset())
         
         # Artificially simulate camera trigger 
         if (box != 0):
@@ -77,9 +98,9 @@ def main(data_path=DATA_PATH):
 
                     if iH / 3 - 5 < cY and iH / 3 + 5 > cY:
                         if flip_flop:
-                            meats += [meat.Meat(box[i], side="Right", center=[cX, cY])]
+                            meats += [tracker.add(meat.Meat(box[i], side="Right", center=[cX, cY]))]
                         else:
-                            meats += [meat.Meat(box[i], side="Left", center=[cX, cY])]
+                            meats += [tracker.add(meat.Meat(box[i], side="Left", center=[cX, cY]))]
                         flip_flop = not flip_flop
                         delay = 0
 
@@ -90,14 +111,14 @@ def main(data_path=DATA_PATH):
         ###############        
         
         if DISPLAY_TOGGLE:
-            cv2.imshow(win, frame)
+            cv2.imshow(win, bounding_box.pad_to_canvas(frame))
 
         ################
         ### Controls ###
         ################
 
-        for i in range(1, len(meats)):
-            meats[i].step()
+        tracker.step()
+        tracker.expire()
 
         if DISPLAY_TOGGLE:
             k = cv2.waitKey(1) & 0xFF
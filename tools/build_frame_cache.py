@@ -0,0 +1,47 @@
+import time
+
+import cv2
+
+from context import source
+from source.vision_identification import frame_cache
+
+'''
+    Decodes a recording into frame caches (see frame_cache.py) ahead of
+    time and compares reading every frame from each cache against
+    decoding the video. Tools and FileVideoStream(buffer="cache") build
+    a missing cache themselves, this only saves the wait on first use.
+'''
+
+DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
+WIDTHS = [250]  # None caches the raw frames, ~6MB each at 1080p
+
+def time_reads(cap):
+    ''' Returns the number of frames read and the ms spent per frame '''
+    count = 0
+    start = time.perf_counter()
+    while True:
+        val, _ = cap.read()
+        if not val:
+            break
+        count += 1
+    cap.release()
+    return count, (time.perf_counter() - start) / max(count, 1) * 1000
+
+def main(data_path=DATA_PATH, widths=WIDTHS):
+    count, decode_ms = time_reads(cv2.VideoCapture(data_path))
+    print("Decoding", count, "frames:", round(decode_ms, 3), "ms/frame")
+
+    for width in widths:
+        start = time.perf_counter()
+        cache_path = frame_cache.build_cache(data_path, width)
+        if cache_path is None:
+            return
+        print("Built", cache_path, "in", round(time.perf_counter() - start, 1), "s")
+
+        cache = frame_cache.FrameCache(cache_path)
+        print(cache)
+        count, read_ms = time_reads(cache)
+        print("Reading", count, "frames:", round(read_ms, 3), "ms/frame")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,69 @@
+import glob
+
+import numpy as np
+import cv2
+
+from context import source
+from source.vision_identification import calibration
+
+'''
+    Creates the calibration file used by calibration.rectify. The lens is
+    calibrated from photos of a chessboard held at different positions and
+    angles in front of the camera. The belt is located from the pixel
+    positions of four marks on it (e.g. the corners of a taped rectangle)
+    whose positions on the belt are measured by hand.
+
+    Set CALIBRATION_FILE in global_parameters to the saved file to use it.
+    The view width times VIDEO_SCALE has to be the scaled frame width (250).
+'''
+
+CHESSBOARD_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\chessboard\*.png"
+CHESSBOARD_SIZE = (9, 6)    # Inner corners per row and column
+SQUARE_SIZE = 0.025         # m
+
+IMAGE_POINTS = [[412, 188], [1507, 176], [1542, 1003], [389, 1021]]      # px in the raw frame
+BELT_POINTS = [[0.05, 0.10], [1.13, 0.10], [1.13, 0.90], [0.05, 0.90]]  # m from the top left of the view
+VIEW_SIZE = [1.18, 2.10]                                                # m
+
+OUTPUT_PATH = r"resources\calibration\camera.npz"
+
+def calibrate_lens(paths):
+    ''' Returns the camera matrix, distortion coefficients and image size found from chessboard images '''
+    board = np.zeros((CHESSBOARD_SIZE[0] * CHESSBOARD_SIZE[1], 3), np.float32)
+    board[:,:2] = np.mgrid[0:CHESSBOARD_SIZE[0], 0:CHESSBOARD_SIZE[1]].T.reshape(-1, 2) * SQUARE_SIZE
+
+    object_points = []
+    image_points = []
+    shape = None
+    for path in paths:
+        gray = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2GRAY)
+        shape = gray.shape[::-1]
+        found, corners = cv2.findChessboardCorners(gray, CHESSBOARD_SIZE, None)
+        if not found:
+            print("Chessboard not found in", path)
+            continue
+
+        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), \
+            (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
+        object_points += [board]
+        image_points += [corners]
+
+    if len(object_points) == 0:
+        print("ERROR: No chessboards found")
+        return None, None, None
+
+    error, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(object_points, image_points, shape, None, None)
+    print("Reprojection error:", error, "px")
+    return camera_matrix, dist_coeffs, shape
+
+def main():
+    camera_matrix, dist_coeffs, image_size = calibrate_lens(glob.glob(CHESSBOARD_PATH))
+    if camera_matrix is None:
+        return
+
+    calibration.save_calibration(OUTPUT_PATH, camera_matrix, dist_coeffs, np.array(IMAGE_POINTS, dtype=np.float64), \
+        np.array(BELT_POINTS, dtype=np.float64), np.array(VIEW_SIZE, dtype=np.float64), np.array(image_size))
+    print("Saved", OUTPUT_PATH)
+
+if __name__=="__main__":
+    main()
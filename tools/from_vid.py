@@ -5,6 +5,7 @@ import cv2
 
 from context import source
 from source.vision_identification import bounding_box
+from source.vision_identification import frame_cache
 from source.vision_identification.meat import Meat 
 
 '''
@@ -14,7 +15,9 @@ from source.vision_identification.meat import Meat
 DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
 
 def main(data_path=DATA_PATH):
-    cap = cv2.VideoCapture(data_path)
+    cap = frame_cache.open_cache(data_path, width=250)
+    if cap is None:
+        return
     # out = cv2.VideoWriter(r'C:\Users\User\Documents\Hylife 2020\Loin Feeder\output6.mp4', 0x7634706d, 30, (500,1059))
 
     delay = 0
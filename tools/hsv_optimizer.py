@@ -0,0 +1,239 @@
+import os
+import json
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import cv2
+
+from context import source
+from source.vision_identification import bounding_box
+from source.global_parameters import global_parameters
+from source.global_parameters import save_parameters
+
+'''
+    Finds LOWER_MASK, UPPER_MASK and MINIMUM_MIDDLE_SIZE from labelled
+    images without any interaction and saves them in a configuration file
+    ready for set_parameters.
+
+    LABELS_PATH is a JSON list with an entry per image:
+
+        {"image": "test0.png", "count": 2, "polygons": [[[x, y], ...], ...]}
+
+    image is relative to the labels file. count is the number of pieces
+    that should be detected, polygons (optional) outline each piece in
+    image pixels, count defaults to their number.
+
+    Every image is scaled and converted to HSV once. If any polygons are
+    given, 3D cumulative histograms of the HSV values of the labelled meat
+    and background pixels let any HSV range be scored (pixel IoU before
+    morphology) with 8 lookups each, and the configured range is first
+    improved one bound at a time on them. The result is then refined by
+    running the full mask, morphology and contour pipeline on every image
+    for the neighbours of the best candidate, in parallel on a process
+    pool. Candidates are ranked by the total detection count error and
+    then by the mean IoU of the refined mask with the polygons.
+'''
+
+LABELS_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\labels.json"
+SCALE_WIDTH = 250
+HIST_BINS = (90, 64, 64)                # H, S, V
+SIZE_FACTORS = [0.7, 0.85, 1, 1.15, 1.3] # Of the configured MINIMUM_MIDDLE_SIZE
+STEPS = [16, 8, 4, 2, 1]                # Bound steps tried by the pipeline search
+WORKERS = None                          # Processes, None uses every core
+OUTPUT_PATH = os.path.join("resources", "configs", "hsv" + datetime.now().strftime("-%d%m%Y-%H%M%S"))
+
+HSV_RANGES = (180, 256, 256)
+
+def load_labels(labels_path, width=SCALE_WIDTH):
+    ''' Returns the HSV frame, expected count and polygon mask (or None) of every labelled image '''
+    with open(labels_path) as f:
+        labels = json.load(f)
+
+    frames = []
+    for label in labels:
+        img = cv2.imread(os.path.join(os.path.dirname(labels_path), label['image']))
+        if img is None:
+            print("ERROR: Could not read", label['image'])
+            continue
+        if 'count' not in label and 'polygons' not in label:
+            print("ERROR: No count or polygons for", label['image'])
+            continue
+
+        truth = None
+        if 'polygons' in label:
+            truth = np.zeros(img.shape, dtype=np.uint8)
+            cv2.fillPoly(truth, [np.int32(p) for p in label['polygons']], (255, 255, 255))
+            truth = np.where(bounding_box.scale(truth, width, method="nearest")[:,:,0] > 127, 255, 0).astype(np.uint8)
+
+        frames += [{
+            "hsv" : cv2.cvtColor(bounding_box.scale(img, width), cv2.COLOR_BGR2HSV),
+            "count" : label.get('count', len(label.get('polygons', []))),
+            "truth" : truth
+        }]
+    return frames
+
+def bin_index(hsv, bins=HIST_BINS):
+    ''' Returns the flat histogram bin of every pixel of an HSV frame '''
+    hsv = hsv.astype(np.int64)
+    h = hsv[:,:,0] * bins[0] // HSV_RANGES[0]
+    s = hsv[:,:,1] * bins[1] // HSV_RANGES[1]
+    v = hsv[:,:,2] * bins[2] // HSV_RANGES[2]
+    return ((h * bins[1] + s) * bins[2] + v).ravel()
+
+def cumulative(hist):
+    ''' Returns the summed volume table of a 3D histogram, with a leading zero plane on each axis '''
+    ret = np.zeros(np.add(hist.shape, 1), dtype=np.int64)
+    ret[1:,1:,1:] = hist.cumsum(0).cumsum(1).cumsum(2)
+    return ret
+
+def build_histograms(frames, bins=HIST_BINS):
+    ''' Returns the cumulative histograms of the labelled meat and background pixels '''
+    meat = np.zeros(np.prod(bins), dtype=np.int64)
+    background = np.zeros(np.prod(bins), dtype=np.int64)
+    for frame in frames:
+        if frame['truth'] is None:
+            continue
+        index = bin_index(frame['hsv'], bins)
+        inside = frame['truth'].ravel() > 0
+        meat += np.bincount(index[inside], minlength=len(meat))
+        background += np.bincount(index[~inside], minlength=len(background))
+    return cumulative(meat.reshape(bins)), cumulative(background.reshape(bins))
+
+def box_count(cum, lo, hi):
+    ''' Returns the number of pixels in bins lo to hi (inclusive) from a cumulative histogram '''
+    a0, a1, a2 = lo
+    b0, b1, b2 = np.add(hi, 1)
+    return cum[b0,b1,b2] - cum[a0,b1,b2] - cum[b0,a1,b2] - cum[b0,b1,a2] \
+        + cum[a0,a1,b2] + cum[a0,b1,a2] + cum[b0,a1,a2] - cum[a0,a1,a2]
+
+def histogram_search(meat, background, lower, upper, bins=HIST_BINS):
+    '''
+    Moves one bound at a time to the bin that most improves the pixel IoU
+    of the range with the labelled meat until no bound moves. Returns the
+    lower and upper HSV bounds of the best range and its IoU.
+    '''
+    total = meat[-1,-1,-1]
+    def iou(lo, hi):
+        return box_count(meat, lo, hi) / max(total + box_count(background, lo, hi), 1)
+
+    lo = [int(lower[c]) * bins[c] // HSV_RANGES[c] for c in range(3)]
+    hi = [int(upper[c]) * bins[c] // HSV_RANGES[c] for c in range(3)]
+    best = iou(lo, hi)
+
+    improved = True
+    while improved:
+        improved = False
+        for c in range(3):
+            for bound in (lo, hi):
+                keep = bound[c]
+                for b in range(bins[c]):
+                    bound[c] = b
+                    if lo[c] <= hi[c]:
+                        score = iou(lo, hi)
+                        if score > best:
+                            best = score
+                            keep = b
+                            improved = True
+                bound[c] = keep
+
+    # First and last value of the chosen bins
+    lower = [-(-lo[c] * HSV_RANGES[c] // bins[c]) for c in range(3)]
+    upper = [-(-(hi[c] + 1) * HSV_RANGES[c] // bins[c]) - 1 for c in range(3)]
+    return lower, upper, best
+
+# Labelled frames of a worker process, set by init_worker
+worker_frames = None
+
+def init_worker(frames):
+    global worker_frames
+    worker_frames = frames
+
+def score(candidate, frames=None):
+    '''
+    Runs the detection pipeline with a (lower, upper, minimum middle size)
+    candidate on every frame and returns the total count error and one
+    minus the mean IoU of the refined masks with the polygons.
+    '''
+    if frames is None:
+        frames = worker_frames
+    lower, upper, size = candidate
+    global_parameters['MINIMUM_AREA'] = size * global_parameters['VIDEO_SCALE']**2
+    border = tuple(global_parameters['CANVAS_PADDING'])
+
+    errors = 0
+    ious = []
+    for frame in frames:
+        mask = cv2.inRange(frame['hsv'], np.array(lower), np.array(upper))
+        refined = bounding_box.refine_mask(mask, bounding_box.get_canvas_shape(frame['hsv']), border=border)
+        data, _ = bounding_box.thresh_callback(refined)
+        errors += abs((0 if data == 0 else len(data)) - frame['count'])
+
+        if frame['truth'] is not None:
+            union = np.count_nonzero(refined | frame['truth'])
+            ious += [np.count_nonzero(refined & frame['truth']) / union if union > 0 else 1]
+
+    return errors, 1 - (np.mean(ious) if len(ious) > 0 else 0)
+
+def neighbours(candidate, step, sizes):
+    ''' Returns every candidate one step away on a single bound, and the candidate at every size '''
+    lower, upper, size = candidate
+    ret = []
+    for c in range(3):
+        for bound in (0, 1):
+            for d in (-step, step):
+                new = [list(lower), list(upper)]
+                new[bound][c] = min(max(new[bound][c] + d, 0), HSV_RANGES[c] - 1)
+                if new[0][c] <= new[1][c] and new[bound][c] != candidate[bound][c]:
+                    ret += [(new[0], new[1], size)]
+    ret += [(list(lower), list(upper), s) for s in sizes if s != size]
+    return ret
+
+def pipeline_search(pool, start, sizes, steps=STEPS):
+    ''' Moves to the best scoring neighbour until none is better, for each step size in turn '''
+    best = start
+    best_score = pool.submit(score, start).result()
+    for step in steps:
+        improved = True
+        while improved:
+            candidates = neighbours(best, step, sizes)
+            scores = list(pool.map(score, candidates))
+            i = min(range(len(candidates)), key=lambda i: scores[i])
+            improved = scores[i] < best_score
+            if improved:
+                best, best_score = candidates[i], scores[i]
+    return best, best_score
+
+def main(labels_path=LABELS_PATH):
+    frames = load_labels(labels_path)
+    if len(frames) == 0:
+        print("ERROR: No labelled images")
+        return
+
+    lower = [int(x) for x in global_parameters['LOWER_MASK']]
+    upper = [int(x) for x in global_parameters['UPPER_MASK']]
+    size = global_parameters['MINIMUM_MIDDLE_SIZE']
+    sizes = [size * f for f in SIZE_FACTORS]
+    initial = score((lower, upper, size), frames)
+
+    if any(frame['truth'] is not None for frame in frames):
+        meat, background = build_histograms(frames)
+        lower, upper, iou = histogram_search(meat, background, lower, upper)
+        print("Histogram search:", lower, upper, "pixel IoU", round(iou, 3))
+
+    with ProcessPoolExecutor(WORKERS, initializer=init_worker, initargs=(frames,)) as pool:
+        best, best_score = pipeline_search(pool, (lower, upper, size), sizes)
+
+    print("%-10s %-16s %-16s %10s %12s %8s" % ("", "Lower", "Upper", "Size m^2", "Count error", "IoU"))
+    print("%-10s %-16s %-16s %10.3f %12d %8.3f" % ("Current", str(global_parameters['LOWER_MASK'].tolist()), \
+        str(global_parameters['UPPER_MASK'].tolist()), size, initial[0], 1 - initial[1]))
+    print("%-10s %-16s %-16s %10.3f %12d %8.3f" % ("Optimised", str(best[0]), str(best[1]), best[2], best_score[0], 1 - best_score[1]))
+
+    global_parameters['LOWER_MASK'] = np.array(best[0])
+    global_parameters['UPPER_MASK'] = np.array(best[1])
+    global_parameters['MINIMUM_MIDDLE_SIZE'] = best[2]
+    global_parameters['MINIMUM_AREA'] = best[2] * global_parameters['VIDEO_SCALE']**2
+    save_parameters(OUTPUT_PATH)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import cv2
+
+from context import source
+from source.vision_identification import bounding_box
+from source.vision_identification import frame_cache
+from source.global_parameters import global_parameters
+
+'''
+    Checks that bounding_box.refine_mask produces a mask bit-identical to
+    the original four pass morphology (new np.ones kernels every call,
+    dilate, erode, dilate, erode) and times both.
+
+    Frames are read from the frame cache of DATA_PATH, which is built on
+    the first run, if the video can be opened, otherwise random
+    masks of blobs and specks are generated. Either way the colour mask
+    is padded onto the robot canvas exactly like the detection pipeline.
+'''
+
+DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
+FRAME_COUNT = 300
+RANDOM_SHAPE = (444, 250)
+
+def legacy_refine(mask, frame_shape):
+    ''' Morphology as gen_mask originally ran it on the padded frame '''
+    k1, k2, k3 = bounding_box.get_kernel_sizes(frame_shape)
+
+    kernel = np.ones(k1)
+    refined = cv2.dilate(mask, kernel)
+
+    kernel = np.ones(k2)
+    refined = cv2.erode(refined, kernel)
+
+    kernel = np.ones(k3)
+    refined = cv2.dilate(refined, kernel)
+    refined = cv2.erode(refined, kernel)
+    return refined
+
+def random_mask(rng, shape=RANDOM_SHAPE):
+    mask = np.zeros(shape, dtype=np.uint8)
+    for _ in range(rng.randint(0, 4)):
+        box = cv2.boxPoints(((rng.randint(0, shape[1]), rng.randint(0, shape[0])), (rng.randint(60, 160), rng.randint(30, 80)), rng.randint(0, 180)))
+        cv2.fillPoly(mask, [np.intp(box)], 255)
+    # Specks and holes
+    noise = rng.randint(0, 1000, shape)
+    mask[noise < 8] = 255
+    mask[noise > 992] = 0
+    return mask
+
+def read_masks(data_path, count):
+    masks = []
+    cap = frame_cache.open_cache(data_path, width=250)
+    if cap is None:
+        return masks
+    while cap.isOpened() and len(masks) < count:
+        val, frame = cap.read()
+        if not val:
+            break
+        frame = bounding_box.scale(frame)
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        masks += [cv2.inRange(hsv, global_parameters['LOWER_MASK'], global_parameters['UPPER_MASK'])]
+    cap.release()
+    return masks
+
+def main(data_path=DATA_PATH, count=FRAME_COUNT):
+    masks = read_masks(data_path, count)
+    if len(masks) == 0:
+        print("Video not available, using random masks.")
+        rng = np.random.RandomState(0)
+        masks = [random_mask(rng) for _ in range(count)]
+
+    legacy_times = []
+    refine_times = []
+    mismatches = 0
+
+    for mask in masks:
+        top, bottom, left, right = global_parameters['CANVAS_PADDING']
+        padded = cv2.copyMakeBorder(mask, top, bottom, left, right, cv2.BORDER_CONSTANT, value=0)
+        frame_shape = padded.shape
+        iH, iW = mask.shape
+
+        start = time.perf_counter()
+        expected = legacy_refine(padded, frame_shape)[top:top + iH, left:left + iW]
+        legacy_times += [time.perf_counter() - start]
+
+        start = time.perf_counter()
+        refined = bounding_box.refine_mask(mask, frame_shape, border=(top, bottom, left, right))
+        refine_times += [time.perf_counter() - start]
+
+        if not np.array_equal(expected, refined):
+            mismatches += 1
+
+    print("Frames:", len(masks))
+    print("Mismatched masks:", mismatches)
+    print("Legacy morphology: %.3f ms/frame" % (np.average(legacy_times) * 1000))
+    print("refine_mask:       %.3f ms/frame" % (np.average(refine_times) * 1000))
+
+    if mismatches:
+        print("ERROR: refine_mask is not bit-identical to the legacy morphology.")
+
+if __name__=="__main__":
+    main()
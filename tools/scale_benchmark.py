@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+import cv2
+
+from context import source
+from source.vision_identification import bounding_box
+from source.vision_identification.meat import Meat
+from synthetic_frames import gen_frames
+
+'''
+    Compares the downscaling methods of bounding_box.scale. Every frame is
+    scaled with each method and run through detection. Detections are
+    matched to the ones found with the original cubic interpolation and
+    the drift of their centroids and Meat.width is reported along with
+    the time spent scaling.
+
+    Frames are read from DATA_PATH if it can be opened, otherwise
+    synthetic frames are generated.
+'''
+
+DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
+FRAME_COUNT = 200
+METHODS = ["cubic", "linear", "nearest", "area", "pyramid", "stride"]
+
+def read_frames(data_path, count):
+    frames = []
+    cap = cv2.VideoCapture(data_path)
+    while cap.isOpened() and len(frames) < count:
+        val, frame = cap.read()
+        if not val:
+            break
+        frames += [frame]
+    cap.release()
+    return frames
+
+def detect(frame):
+    ''' Returns the centroids and widths of every piece found in a scaled frame '''
+    canvas_shape = bounding_box.get_canvas_shape(frame)
+    data, _, _ = bounding_box.get_bbox(frame, frame_shape=canvas_shape, offset=bounding_box.get_canvas_offset())
+
+    if data == 0 or len(data) == 0:
+        return np.zeros((0, 3))
+
+    centers = [[d[1]["m10"] / d[1]["m00"], d[1]["m01"] / d[1]["m00"]] for d in data]
+    meats = Meat.from_batch([d[0] for d in data], ["Left"] * len(data), centers)
+    return np.array([[c[0], c[1], m.width] for c, m in zip(centers, meats)])
+
+def main(data_path=DATA_PATH, count=FRAME_COUNT):
+    frames = read_frames(data_path, count)
+    if len(frames) == 0:
+        print("Video not available, using synthetic frames.")
+        frames = gen_frames(count)
+
+    references = [detect(bounding_box.scale(frame, method="cubic")) for frame in frames]
+
+    print("Auto method for this video:", bounding_box.get_scale_method(frames[0].shape[1] / 250))
+    print("%-8s %10s %16s %16s %12s %10s" % ("Method", "ms/frame", "centroid px avg", "centroid px max", "width px avg", "missed"))
+    for method in METHODS:
+        times = []
+        centroid_drift = []
+        width_drift = []
+        missed = 0
+
+        for frame, reference in zip(frames, references):
+            start = time.perf_counter()
+            scaled = bounding_box.scale(frame, method=method)
+            times += [time.perf_counter() - start]
+
+            found = detect(scaled)
+            for piece in reference:
+                if len(found) == 0:
+                    missed += 1
+                    continue
+                dists = np.linalg.norm(found[:,0:2] - piece[0:2], axis=1)
+                closest = np.argmin(dists)
+                # Anything further than a piece width away is a different piece
+                if dists[closest] > piece[2]:
+                    missed += 1
+                    continue
+                centroid_drift += [dists[closest]]
+                width_drift += [abs(found[closest][2] - piece[2])]
+
+        centroid_drift = centroid_drift or [0]
+        width_drift = width_drift or [0]
+        print("%-8s %10.3f %16.2f %16.2f %12.2f %10d" % (method, np.average(times) * 1000, np.average(centroid_drift), \
+            np.max(centroid_drift), np.average(width_drift), missed))
+
+if __name__=="__main__":
+    main()
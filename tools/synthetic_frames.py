@@ -0,0 +1,40 @@
+import numpy as np
+import cv2
+
+from context import source
+from source.global_parameters import global_parameters
+
+'''
+    Generates camera-like frames for the benchmark tools when no recorded
+    video is available. Each frame is a noisy dark belt with a few
+    rotated rectangles and specks coloured inside the configured HSV mask.
+'''
+
+FRAME_SHAPE = (1920, 1080)
+
+def meat_colour():
+    ''' Returns a BGR colour in the middle of the configured HSV mask '''
+    hsv = ((np.asarray(global_parameters['LOWER_MASK']) + np.asarray(global_parameters['UPPER_MASK'])) // 2).astype(np.uint8)
+    bgr = cv2.cvtColor(hsv.reshape((1, 1, 3)), cv2.COLOR_HSV2BGR)[0, 0]
+    return tuple(int(c) for c in bgr)
+
+def gen_frame(rng, shape=FRAME_SHAPE, pieces=3, specks=40):
+    iH, iW = shape
+    frame = np.full([iH, iW, 3], (40, 60, 50), dtype=np.uint8)
+    frame = cv2.add(frame, rng.randint(0, 30, (iH, iW, 3)).astype(np.uint8))
+    colour = meat_colour()
+
+    # Pieces are sized relative to the frame width like the real camera (roughly 0.6 x 0.3 m)
+    for _ in range(pieces):
+        center = (rng.randint(iW//4, 3*iW//4), rng.randint(0, iH))
+        size = (rng.randint(iW//2, 3*iW//5), rng.randint(iW//4, 3*iW//10))
+        box = cv2.boxPoints((center, size, rng.randint(0, 180)))
+        cv2.fillPoly(frame, [np.intp(box)], colour)
+    for _ in range(specks):
+        cv2.circle(frame, (rng.randint(0, iW), rng.randint(0, iH)), rng.randint(2, 8), colour, -1)
+
+    return frame
+
+def gen_frames(count, seed=0, shape=FRAME_SHAPE):
+    rng = np.random.RandomState(seed)
+    return [gen_frame(rng, shape) for _ in range(count)]
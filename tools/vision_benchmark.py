@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from context import source
+from source.vision_identification import bounding_box
+from source.vision_identification import frame_cache
+from source.vision_identification.meat import Meat
+from source.global_parameters import global_parameters
+from synthetic_frames import gen_frames
+
+'''
+    Times each stage of the vision pipeline on every frame:
+
+        scale       bounding_box.scale of the raw frame
+        mask        gen_mask of the scaled frame on the robot canvas
+        contours    thresh_callback of the mask
+        meat        Meat.from_batch of every box found
+        total       All of the above
+
+    and reports the p50/p95/p99 latency in ms and frames/s of each. Results
+    are saved as JSON to OUTPUT_DIR along with the parameters that change
+    the cost of the pipeline. If BASELINE_PATH exists every stage is
+    compared against it and the script exits with 1 if any p50 is more
+    than TOLERANCE slower. Copy a result to BASELINE_PATH to set a baseline.
+
+    Frames are read from a frame cache of the first FRAME_COUNT frames of
+    DATA_PATH, built on the first run, if the video can be opened, and are
+    otherwise synthetic frames generated from SEED. Baselines should be
+    compared on the same source and machine.
+'''
+
+DATA_PATH = r"C:\Users\User\Documents\Hylife 2020\Loin Feeder\Data\good.mp4"
+FRAME_COUNT = 200
+WARMUP = 10 # Frames run first and not timed
+SEED = 0
+OUTPUT_DIR = os.path.join("resources", "logs", "benchmarks")
+BASELINE_PATH = os.path.join(OUTPUT_DIR, "vision-baseline.json")
+TOLERANCE = 0.1
+
+STAGES = ["scale", "mask", "contours", "meat", "total"]
+PARAMETERS = ["SCALE_METHOD", "CALIBRATION_FILE", "COLOUR_LUT", "ORIENTED_BOXES", "STRIPE_THREADS", "CANVAS_PADDING", "MINIMUM_AREA"]
+
+def read_frames(data_path, count):
+    ''' Returns the first count raw frames of a recording from their frame cache, None if it cannot be read '''
+    cache_path = frame_cache.get_cache_path(data_path) + "-" + str(count)
+    if not os.path.exists(cache_path + ".npz") and frame_cache.build_cache(data_path, cache_path=cache_path, count=count) is None:
+        return None
+    return frame_cache.open_cache(cache_path)
+
+def run_frame(frame):
+    ''' Runs one frame through the pipeline and returns the time of each stage in s '''
+    times = {}
+    start = time.perf_counter()
+
+    scaled = bounding_box.scale(frame)
+    t1 = time.perf_counter()
+
+    top, bottom, left, right = global_parameters['CANVAS_PADDING']
+    mask = bounding_box.gen_mask(scaled, frame_shape=bounding_box.get_canvas_shape(scaled), border=(top, bottom, left, right))
+    t2 = time.perf_counter()
+
+    data, _ = bounding_box.thresh_callback(mask, offset=bounding_box.get_canvas_offset())
+    t3 = time.perf_counter()
+
+    if data != 0 and len(data) > 0:
+        centers = [[d[1]["m10"] / d[1]["m00"], d[1]["m01"] / d[1]["m00"]] for d in data]
+        Meat.from_batch([d[0] for d in data], ["Left", "Right"] * (len(data) // 2) + ["Left"] * (len(data) % 2), centers)
+    t4 = time.perf_counter()
+
+    times["scale"] = t1 - start
+    times["mask"] = t2 - t1
+    times["contours"] = t3 - t2
+    times["meat"] = t4 - t3
+    times["total"] = t4 - start
+    return times
+
+def summarise(samples):
+    ''' Returns the latency percentiles in ms and the rate of a list of times in s '''
+    ms = np.array(samples) * 1000
+    return {
+        "p50_ms" : float(np.percentile(ms, 50)),
+        "p95_ms" : float(np.percentile(ms, 95)),
+        "p99_ms" : float(np.percentile(ms, 99)),
+        "mean_ms" : float(ms.mean()),
+        "fps" : float(1000 / max(ms.mean(), 1e-9))
+    }
+
+def run(frames, warmup=WARMUP):
+    ''' Returns the summary of every stage over frames '''
+    for i in range(min(warmup, len(frames))):
+        run_frame(frames[i])
+
+    samples = {stage : [] for stage in STAGES}
+    for i in range(len(frames)):
+        for stage, t in run_frame(frames[i]).items():
+            samples[stage] += [t]
+    return {stage : summarise(samples[stage]) for stage in STAGES}
+
+def compare(result, baseline, tolerance=TOLERANCE):
+    ''' Prints every stage against the baseline and returns the stages whose p50 regressed '''
+    regressions = []
+    print("%-10s %12s %12s %10s" % ("Stage", "base p50 ms", "p50 ms", "change"))
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        old = baseline['stages'][stage]['p50_ms']
+        new = result['stages'][stage]['p50_ms']
+        change = (new - old) / max(old, 1e-9)
+        flag = ""
+        if change > tolerance:
+            regressions += [stage]
+            flag = " REGRESSION"
+        print("%-10s %12.3f %12.3f %+9.1f%%%s" % (stage, old, new, change * 100, flag))
+
+    if baseline['source'] != result['source'] or baseline['frames'] != result['frames']:
+        print("Warning: the baseline was run on", baseline['frames'], "frames of", baseline['source'])
+    for key in PARAMETERS:
+        if baseline['parameters'].get(key) != result['parameters'][key]:
+            print("Warning:", key, "was", baseline['parameters'].get(key), "in the baseline")
+    return regressions
+
+def main(data_path=DATA_PATH, count=FRAME_COUNT):
+    frames = read_frames(data_path, count)
+    source_name = data_path
+    if frames is None:
+        print("Video not available, using synthetic frames.")
+        frames = gen_frames(count, seed=SEED)
+        source_name = "synthetic-" + str(SEED)
+
+    result = {
+        "date" : datetime.now().isoformat(timespec="seconds"),
+        "source" : source_name,
+        "frames" : len(frames),
+        "frame_shape" : list(frames[0].shape),
+        "parameters" : {key : np.asarray(global_parameters[key]).tolist() for key in PARAMETERS},
+        "stages" : run(frames)
+    }
+
+    print("%-10s %10s %10s %10s %10s" % ("Stage", "p50 ms", "p95 ms", "p99 ms", "frames/s"))
+    for stage in STAGES:
+        s = result['stages'][stage]
+        print("%-10s %10.3f %10.3f %10.3f %10.1f" % (stage, s['p50_ms'], s['p95_ms'], s['p99_ms'], s['fps']))
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_path = os.path.join(OUTPUT_DIR, "vision-" + datetime.now().strftime("%d%m%Y-%H%M%S") + ".json")
+    with open(output_path, "w") as f:
+        json.dump(result, f, indent=4)
+    print("Saved", output_path)
+
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if len(compare(result, baseline)) > 0:
+            sys.exit(1)
+
+if __name__=="__main__":
+    main()